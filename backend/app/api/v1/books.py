@@ -1,35 +1,20 @@
-from fastapi import APIRouter
-import os
-from app.core.config import settings
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import JSONResponse
+from app.services.book_catalog import catalog
 
 router = APIRouter()
 
 @router.get("/")
-def get_books():
+async def get_books(request: Request):
     """
-    List available books by scanning the assets/templates directory.
-    Returns a list of book IDs (folder names) and their titles.
+    List available books (served from the in-memory catalog, see book_catalog.py).
+    Returns id, title, page count, roles, version, hash and a cover thumbnail URL per book.
     """
-    # Define Assets Root
-    # Assuming backend/assets
-    assets_root = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), "assets")
-    templates_dir = os.path.join(assets_root, "templates")
-    
-    if not os.path.exists(templates_dir):
-        return []
+    if catalog.etag is None:
+        # Startup indexing has not run (e.g. app used without lifespan events)
+        catalog.rebuild()
 
-    books = []
-    for folder_name in os.listdir(templates_dir):
-        folder_path = os.path.join(templates_dir, folder_name)
-        if os.path.isdir(folder_path):
-            # Try to read metadata if exists, else use folder name title
-            # For now, Simple: Book ID = Folder Name
-            title = folder_name.replace("_", " ").title()
-            
-            books.append({
-                "id": folder_name,
-                "title": title,
-                "cover_url": f"/static/templates/{folder_name}/cover.png" # Placeholder
-            })
-            
-    return books
+    headers = {"ETag": catalog.etag, "Cache-Control": "public, max-age=60"}
+    if request.headers.get("if-none-match") == catalog.etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=catalog.books, headers=headers)
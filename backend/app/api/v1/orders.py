@@ -1,141 +1,374 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-
-from sqlalchemy.orm import Session
-from app.db.session import get_db
-from app.db.models import Order, OrderStatus
-from app.schemas.order import OrderCreate, OrderResponse
-from app.worker.tasks import process_order_v2
-from app.services.ai import validator
-import shutil
+from typing import List, Optional
+from datetime import datetime
+from types import SimpleNamespace
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query
+
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, JSONResponse
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from app.db.session import get_async_db
+from app.db.models import Order, OrderPage, OrderStatus
+from app.schemas.order import OrderCreate, OrderResponse, OrderStatusSchema
+from app.worker.tasks import process_order_v2, validate_upload
+from app.services import validation_jobs, upload_store, progress, order_cache, admission
+from app.utils import upload_ingest
 import os
+import json
+import base64
 import uuid
+import asyncio
 
 router = APIRouter()
 
 # ... existing code ...
 
 @router.get("/", response_model=List[OrderResponse])
-def get_all_orders(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def get_all_orders(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    status: Optional[OrderStatus] = None,
+    story_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    Get all orders (for Swagger/Admin use).
+    Get all orders (for Swagger/Admin use), newest first.
+    Keyset pagination on (created_at, id): pass the X-Next-Cursor header of the
+    previous page as `cursor`. Optional filters: status, story_id.
     """
-    orders = db.query(Order).offset(skip).limit(limit).all()
+    query = select(Order).options(selectinload(Order.generated_pages))
+    if status:
+        query = query.filter(Order.status == status)
+    if story_id:
+        query = query.filter(Order.story_id == story_id)
+    if cursor:
+        try:
+            cursor_created_at, cursor_id = _decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.filter(tuple_(Order.created_at, Order.id) < tuple_(cursor_created_at, cursor_id))
+
+    result = await db.execute(
+        query.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit)
+    )
+    orders = result.scalars().all()
+    if len(orders) == limit:
+        response.headers["X-Next-Cursor"] = _encode_cursor(orders[-1])
     return orders
 
+def _encode_cursor(order: Order) -> str:
+    raw = f"{order.created_at.isoformat()}|{order.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, order_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(order_id)
+    except Exception as e:
+        raise ValueError(str(e))
+
 # Determine upload directory
 UPLOAD_DIR = "uploads"
 if not os.path.exists(UPLOAD_DIR):
     os.makedirs(UPLOAD_DIR)
 
 @router.post("/upload")
-def upload_photo(file: UploadFile = File(...)):
+async def upload_photo(request: Request):
     """
-    Receives a photo, saves it locally, and validates it using Local Validator.
+    Receives a photo (multipart field `file`, or a raw image body), saves it locally
+    and queues validation.
+    Returns immediately with an upload_id; poll GET /upload/{upload_id} for the result.
     """
+    # 1. Stream to disk straight from the request body (size cap, header sniff,
+    #    SHA-256 on the way through); nothing is spooled before these checks run
     try:
-        # 1. Save file locally
-        file_id = str(uuid.uuid4())
-        filename = f"{file_id}_{file.filename}"
-        file_path = os.path.join(UPLOAD_DIR, filename)
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        ingested = await upload_ingest.ingest_request(request, UPLOAD_DIR)
+    except upload_ingest.UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        return _upload_failed(e)
+    return await run_in_threadpool(_store_upload, ingested)
+
+def _store_upload(ingested: upload_ingest.IngestedUpload) -> dict:
+    try:
+        # 2. Content-addressed storage (duplicates share one blob + its cached work)
+        file_id, stored = upload_store.register(ingested)
+
+        # 3. Normalized working copy (once per content); the original stays for print
+        file_path = upload_store.normalized_path(stored)
             
         from pathlib import Path
         fake_url = Path(os.path.abspath(file_path)).as_uri()
+        original_url = Path(os.path.abspath(stored.path)).as_uri()
+
+        if stored.validation:
+            # Same photo was validated before
+            job = validation_jobs.set_status(
+                file_id, validation_jobs.STATUS_DONE,
+                url=fake_url, original_url=original_url, local_path=file_path, sha256=ingested.sha256, **stored.validation
+            )
+            return {**job, "cached": True}
                 
-        # Run Validation
-        # Enabled for HuggingFace Spaces
-        validation_result = validator.validate_photo(fake_url)
+        # 4. Queue Validation (runs on the 'validation' worker queue, not in this request)
+        validation_jobs.set_status(file_id, validation_jobs.STATUS_PENDING, url=fake_url, original_url=original_url, local_path=file_path, sha256=ingested.sha256)
+        validate_upload.apply_async(args=[file_id, fake_url], kwargs={"content_hash": ingested.sha256})
         
-        # Default Success Response
         return {
+            "upload_id": file_id,
+            "status": validation_jobs.STATUS_PENDING,
             "url": fake_url, 
-            "local_path": file_path, 
-            "valid": validation_result["valid"],
-            "reason": validation_result.get("reason", ""),
-            "checks": validation_result.get("checks", {})
+            "original_url": original_url,
+            "local_path": file_path,
+            "sha256": ingested.sha256
         }
     except Exception as e:
-        print(f"Upload Endpoint Critical Error: {e}")
-        return {
-            "url": "",
-            "local_path": "",
-            "valid": False,
-            "reason": f"Server Upload Error: {str(e)}",
-            "checks": {}
-        }
+        return _upload_failed(e)
+
+def _upload_failed(e: Exception) -> dict:
+    print(f"Upload Endpoint Critical Error: {e}")
+    return {
+        "upload_id": None,
+        "status": validation_jobs.STATUS_FAILED,
+        "url": "",
+        "local_path": "",
+        "valid": False,
+        "reason": f"Server Upload Error: {str(e)}",
+        "checks": {}
+    }
+
+@router.get("/upload/{upload_id}")
+def get_upload_status(upload_id: str):
+    """
+    Poll endpoint for upload validation.
+    status: PENDING | DONE | FAILED. When DONE, includes valid / reason / checks.
+    """
+    job = validation_jobs.get_status(upload_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return job
+
+@router.delete("/upload/{upload_id}")
+def delete_upload(upload_id: str):
+    """
+    Releases an upload_id. The stored photo (and its derived artifacts) is deleted
+    once no upload_id or order references it anymore.
+    """
+    if not upload_store.release(upload_id):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return {"upload_id": upload_id, "released": True}
 
 @router.post("/create", response_model=OrderResponse)
-def create_order(order_in: OrderCreate, db: Session = Depends(get_db)):
+async def create_order(order_in: OrderCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Creates an order order row and triggers the Async Worker.
+    Returns 503 + Retry-After (with an ETA) when the worker is over capacity.
     """
-    # Create DB Row (Status: QUEUED)
-    # Note: Prompt says "QUEUED", but Enum has "DRAFT", "PROCESSING". 
-    # I'll use PROCESSING as equivalent to Queued/Running for now, or add Queued.
-    # Enum in models.py: DRAFT, PROCESSING, COMPLETED, FAILED.
-    # Let's use PROCESSING or DRAFT then trigger.
+    # Admission Control (before anything is written). Admitting records the order
+    # id right away, so queued orders count against capacity until they finish.
+    order_id = uuid.uuid4()
+    decision = await run_in_threadpool(admission.admit, order_id)
+    if not decision.admitted:
+        print(f"Order rejected by admission control: {decision.reason}")
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": str(decision.retry_after)},
+            content={
+                "detail": f"We're busy creating other books right now. Please try again in about {max(1, decision.retry_after // 60)} minutes.",
+                "reason": decision.reason,
+                "retry_after": decision.retry_after,
+                "eta_seconds": decision.eta_seconds,
+                "queue_depth": decision.queue_depth,
+                "in_flight_orders": decision.in_flight_orders
+            }
+        )
+
+    try:
+        # Create DB Row (Status: QUEUED)
+        # Note: Prompt says "QUEUED", but Enum has "DRAFT", "PROCESSING". 
+        # I'll use PROCESSING as equivalent to Queued/Running for now, or add Queued.
+        # Enum in models.py: DRAFT, PROCESSING, COMPLETED, FAILED.
+        # Let's use PROCESSING or DRAFT then trigger.
     
-    # Default to Space Adventure if no story provided
-    if not order_in.story_id:
-        # Ideally fetch by title or env var, here we hardcode valid UUID or query it
-        # Let's query it dynamically to be safe
-        from app.db.models import Story
-        default_story = db.query(Story).filter(Story.title == "The Space Adventure").first()
-        if default_story:
-            order_in.story_id = str(default_story.id)
-
-    db_order = Order(
-        child_name=order_in.child_name,
-        photo_url=order_in.photo_url,
-        mom_name=order_in.mom_name,
-        mom_photo_url=order_in.mom_photo_url,
-        story_id=order_in.story_id,
-        status=OrderStatus.PROCESSING 
-    )
-    db.add(db_order)
-    db.commit()
-    db.refresh(db_order)
+        # Default to Space Adventure if no story provided
+        if not order_in.story_id:
+            # Ideally fetch by title or env var, here we hardcode valid UUID or query it
+            # Let's query it dynamically to be safe
+            from app.db.models import Story
+            default_story = (await db.execute(
+                select(Story).filter(Story.title == "The Space Adventure")
+            )).scalars().first()
+            if default_story:
+                order_in.story_id = str(default_story.id)
+
+        db_order = Order(
+            id=order_id,
+            child_name=order_in.child_name,
+            photo_url=order_in.photo_url,
+            mom_name=order_in.mom_name,
+            mom_photo_url=order_in.mom_photo_url,
+            story_id=order_in.story_id,
+            status=OrderStatus.PROCESSING 
+        )
+        db.add(db_order)
+        await db.commit()
+        await db.refresh(db_order, attribute_names=["generated_pages"])
+
+        # The order holds its own reference on the stored photos until it finishes,
+        # so releasing the upload_id (DELETE /upload/{id}) cannot remove them mid-order
+        await run_in_threadpool(upload_store.acquire_for_order, db_order.id, [db_order.photo_url, db_order.mom_photo_url])
     
-    # Trigger Celery Task - Approach B
-    from app.worker.tasks import process_approach_b
+        # Trigger Celery Task - Approach B
+        from app.worker.tasks import process_approach_b
     
-    # Use story_id as book_id, defaulting to book_sample if needed
-    # (In DB story_id might be a UUID, but for Approach B file structs we use keys like 'book_sample')
-    # For MVP, we force "book_sample" unless mapped. 
-    # Let's assume order_in.story_id contains the key like "book_sample" if provided, 
-    # or if it's a UUID, the task needs to look it up.
-    # Given the task.py logic: book_id="book_sample" default.
-    # Dynamic Book ID
-    # We use story_id as the folder name (book_id)
-    target_book_id = order_in.story_id if order_in.story_id else "magic_of_money"
-    print(f"Creating Order for Book: {target_book_id}") 
+        # Use story_id as book_id, defaulting to book_sample if needed
+        # (In DB story_id might be a UUID, but for Approach B file structs we use keys like 'book_sample')
+        # For MVP, we force "book_sample" unless mapped. 
+        # Let's assume order_in.story_id contains the key like "book_sample" if provided, 
+        # or if it's a UUID, the task needs to look it up.
+        # Given the task.py logic: book_id="book_sample" default.
+        # Dynamic Book ID
+        # We use story_id as the folder name (book_id)
+        target_book_id = order_in.story_id if order_in.story_id else "magic_of_money"
+        print(f"Creating Order for Book: {target_book_id}") 
     
-    # Pass Mom photo URL to task as well
-    # We might need to update task signature to accept kwargs or expanded args
-    # For now, let's keep it simple: pass order_id and let task read DB for details?
-    # Actually task.py currently takes: (order_id, photo_url, book_id).
-    # We should update task signature. For now, let's pass child photo_url as primary, 
-    # but the task will read order.mom_photo_url from DB if needed.
-    # Actually, task reads 'photo_url' arg, but it also queries DB.
-    # Let's rely on DB for the second photo.
+        # Pass Mom photo URL to task as well
+        # We might need to update task signature to accept kwargs or expanded args
+        # For now, let's keep it simple: pass order_id and let task read DB for details?
+        # Actually task.py currently takes: (order_id, photo_url, book_id).
+        # We should update task signature. For now, let's pass child photo_url as primary, 
+        # but the task will read order.mom_photo_url from DB if needed.
+        # Actually, task reads 'photo_url' arg, but it also queries DB.
+        # Let's rely on DB for the second photo.
     
-    # Explicitly pass book_id as kwarg to avoid positional mapping issues with stale workers
-    process_approach_b.apply_async(
-        args=[str(db_order.id), db_order.photo_url],
-        kwargs={"book_id": target_book_id}
-    )
+        # Explicitly pass book_id as kwarg to avoid positional mapping issues with stale workers
+        # Broker publish is blocking I/O; keep it off the event loop
+        await run_in_threadpool(
+            process_approach_b.apply_async,
+            args=[str(db_order.id), db_order.photo_url],
+            kwargs={"book_id": target_book_id}
+        )
+    
+    except BaseException:
+        # Not enqueued: free the admission slot and the photo references
+        await run_in_threadpool(admission.order_finished, order_id)
+        await run_in_threadpool(upload_store.release_order, order_id)
+        raise
     
     return db_order
 
 @router.get("/{order_id}", response_model=OrderResponse)
-def get_order(order_id: uuid.UUID, db: Session = Depends(get_db)):
+async def get_order(order_id: uuid.UUID, db: AsyncSession = Depends(get_async_db)):
     """
     Fetches order status.
+    Served from the Redis write-through cache; Postgres only on a miss.
     """
-    order = db.query(Order).filter(Order.id == order_id).first()
+    cached = await order_cache.read_async(order_id)
+    if cached:
+        return cached
+
+    order = (await db.execute(
+        select(Order).options(selectinload(Order.generated_pages)).filter(Order.id == order_id)
+    )).scalars().first()
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
+    await order_cache.write_async(order_cache.to_fields(order))
     return order
+
+@router.get("/{order_id}/status", response_model=OrderStatusSchema)
+async def get_order_status(order_id: uuid.UUID, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    """
+    Lightweight status for polling.
+    ETag follows Order.version; a matching If-None-Match returns 304 from the
+    cached order (or the order row alone on a cache miss).
+    """
+    cached = await order_cache.read_async(order_id)
+    if cached:
+        row = SimpleNamespace(**cached)
+    else:
+        row = (await db.execute(
+            select(Order.id, Order.status, Order.version, Order.failure_reason).filter(Order.id == order_id)
+        )).first()
+        if not row:
+            raise HTTPException(status_code=404, detail="Order not found")
+
+    etag = f'W/"{row.id}-{row.version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+
+    if cached:
+        completed_pages = cached["completed_pages"]
+    else:
+        completed_pages = await db.scalar(
+            select(func.count()).select_from(OrderPage).filter(OrderPage.order_id == order_id)
+        )
+    response.headers.update(headers)
+    return OrderStatusSchema(
+        id=row.id,
+        status=row.status,
+        completed_pages=completed_pages or 0,
+        version=row.version,
+        failure_reason=row.failure_reason
+    )
+
+@router.get("/{order_id}/events")
+async def stream_order_events(order_id: uuid.UUID, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    Server-Sent Events: stage events published by the worker
+    (master_ready, page_generated, page_composited, completed, failed).
+    Starts with a 'snapshot' of the current status, ends after a terminal event.
+    """
+    # Subscribe before reading the snapshot, so an event published in between is not lost
+    queue = progress.broker.subscribe(str(order_id))
+    try:
+        live = await progress.broker.wait_ready()
+        row = (await db.execute(
+            select(Order.status, Order.version, Order.failure_reason).filter(Order.id == order_id)
+        )).first()
+    except BaseException:
+        progress.broker.unsubscribe(str(order_id), queue)
+        raise
+    if not row:
+        progress.broker.unsubscribe(str(order_id), queue)
+        raise HTTPException(status_code=404, detail="Order not found")
+    snapshot = {
+        "order_id": str(order_id),
+        "event": "snapshot",
+        "status": row.status.value,
+        "version": row.version,
+        "failure_reason": row.failure_reason
+    }
+    # Do not hold a pooled DB connection for the lifetime of the stream
+    await db.close()
+
+    async def event_stream():
+        try:
+            yield _sse(snapshot)
+            if row.status in (OrderStatus.COMPLETED, OrderStatus.FAILED):
+                return
+            if not live:
+                # Redis subscription unavailable: end the stream, the client falls back to polling
+                return
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse(event)
+                if event.get("event") in progress.TERMINAL_EVENTS:
+                    return
+        finally:
+            progress.broker.unsubscribe(str(order_id), queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _sse(event: dict) -> str:
+    return f"event: {event.get('event', 'message')}\ndata: {json.dumps(event)}\n\n"
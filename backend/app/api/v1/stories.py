@@ -1,6 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form
-from sqlalchemy.orm import Session
-from app.db.session import get_db
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from app.db.session import get_async_db
 from app.db.models import Story, StoryPage
 from app.db.schemas import StoryResponse, StoryListResponse
 from app.core.config import settings
@@ -13,21 +16,21 @@ import json
 router = APIRouter()
 
 @router.get("", response_model=List[StoryListResponse])
-def list_stories(db: Session = Depends(get_db)):
+async def list_stories(db: AsyncSession = Depends(get_async_db)):
     """Get all available story templates"""
-    stories = db.query(Story).all()
-    return stories
+    result = await db.execute(select(Story))
+    return result.scalars().all()
 
 @router.get("/{story_id}", response_model=StoryResponse)
-def get_story(story_id: uuid.UUID, db: Session = Depends(get_db)):
+async def get_story(story_id: uuid.UUID, db: AsyncSession = Depends(get_async_db)):
     """Get a specific story with all its page templates"""
-    story = db.query(Story).filter(Story.id == story_id).first()
+    story = await _get_story_with_pages(db, story_id)
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
     return story
 
 @router.post("", response_model=StoryResponse)
-def create_story(
+async def create_story(
     title: str = Form(...),
     description: str = Form(...),
     price: float = Form(19.99),
@@ -36,7 +39,7 @@ def create_story(
     page_images: List[UploadFile] = File(...),
     # Metadata as a JSON string: [{"filename": "page1.png", "x": 100...}, ...]
     pages_json: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Create a new Story with cover and pages.
@@ -57,7 +60,7 @@ def create_story(
             cover_image_url="" # Will update after save
         )
         db.add(new_story)
-        db.flush() # Get ID
+        await db.flush() # Get ID
         
         # 3. Setup Directories
         base_upload_dir = "uploads/stories"
@@ -68,8 +71,7 @@ def create_story(
         cover_filename = f"cover_{cover_image.filename}"
         cover_path = os.path.join(story_dir, cover_filename)
         
-        with open(cover_path, "wb") as buffer:
-            shutil.copyfileobj(cover_image.file, buffer)
+        await run_in_threadpool(_save_upload, cover_image, cover_path)
             
         # Construct Public URL (Assuming localhost for now, should be env based really)
         # Using relative path for robustness if accessed via proxy, but schema expects URL.
@@ -99,9 +101,7 @@ def create_story(
             page_filename = f"page_{i+1}_{fname}"
             page_path = os.path.join(story_dir, page_filename)
             
-            with open(page_path, "wb") as buffer:
-                file_obj.file.seek(0) # Ensure start
-                shutil.copyfileobj(file_obj.file, buffer)
+            await run_in_threadpool(_save_upload, file_obj, page_path)
                 
             page_url = f"{settings.BASE_URL}/{convert_path_to_url(page_path)}"
             
@@ -117,30 +117,35 @@ def create_story(
             )
             db.add(new_page)
             
-        db.commit()
-        db.refresh(new_story)
-        return new_story
+        await db.commit()
+        return await _get_story_with_pages(db, new_story.id)
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Error creating story: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _save_upload(upload: UploadFile, path: str) -> None:
+    """Blocking file copy; run in the threadpool so large uploads do not stall the event loop."""
+    with open(path, "wb") as buffer:
+        upload.file.seek(0) # Ensure start
+        shutil.copyfileobj(upload.file, buffer)
+
 @router.put("/{story_id}", response_model=StoryResponse)
-def update_story(
+async def update_story(
     story_id: uuid.UUID,
     title: str = Form(None),
     description: str = Form(None),
     price: float = Form(None),
     # Optional: Update coordinates via JSON
     pages_json: str = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Update Story details and Page Coordinates.
     Does NOT support replacing images yet (use Create for that or separate endpoint).
     """
-    story = db.query(Story).filter(Story.id == story_id).first()
+    story = await _get_story_with_pages(db, story_id)
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
         
@@ -158,10 +163,7 @@ def update_story(
                 p_num = update.get("page_number")
                 if p_num is None: continue
                 
-                page = db.query(StoryPage).filter(
-                    StoryPage.story_id == story.id,
-                    StoryPage.page_number == p_num
-                ).first()
+                page = next((pg for pg in story.pages if pg.page_number == p_num), None)
                 
                 if page:
                     if "x" in update: page.face_x = update["x"]
@@ -172,16 +174,22 @@ def update_story(
         except json.JSONDecodeError:
             raise HTTPException(status_code=400, detail="Invalid JSON in pages_json")
             
-    db.commit()
-    db.refresh(story)
+    await db.commit()
     return story
 
+async def _get_story_with_pages(db: AsyncSession, story_id) -> Story:
+    # Pages are eager-loaded: lazy loads are not available on AsyncSession
+    result = await db.execute(
+        select(Story).options(selectinload(Story.pages)).filter(Story.id == story_id)
+    )
+    return result.scalars().first()
+
 def convert_path_to_url(path: str) -> str:
     # Converts "uploads\\stories\\...\\file.png" to "uploads/stories/.../file.png"
     return path.replace("\\", "/")
 
 @router.post("/seed")
-def seed_stories(db: Session = Depends(get_db)):
+async def seed_stories(db: AsyncSession = Depends(get_async_db)):
     """
     Seeds the database with stories corresponding to the available file templates.
     """
@@ -215,7 +223,9 @@ def seed_stories(db: Session = Depends(get_db)):
 
     for tmpl in templates_to_seed:
         # Check if exists by title
-        existing = db.query(Story).filter(Story.title == tmpl["title"]).first()
+        existing = (await db.execute(
+            select(Story).filter(Story.title == tmpl["title"])
+        )).scalars().first()
         story_id = None
         
         if existing:
@@ -223,7 +233,7 @@ def seed_stories(db: Session = Depends(get_db)):
             print(f"Update existing story: {tmpl['title']}")
             existing.cover_image_url = tmpl["cover_url"]
             existing.description = tmpl["description"] # Update description
-            db.commit()
+            await db.commit()
         else:
             print(f"Creating new story: {tmpl['title']}")
             new_story = Story(
@@ -233,7 +243,7 @@ def seed_stories(db: Session = Depends(get_db)):
                 price=tmpl["price"]
             )
             db.add(new_story)
-            db.flush()
+            await db.flush()
             story_id = new_story.id
         
         # We also need to ensure Pages exist? 
@@ -243,7 +253,10 @@ def seed_stories(db: Session = Depends(get_db)):
         # UNLESS the frontend 'Read' view relies on them.
         
         # Let's seed dummy pages just in case frontend crashes without them
-        if db.query(StoryPage).filter(StoryPage.story_id == story_id).count() == 0:
+        page_count = await db.scalar(
+            select(func.count()).select_from(StoryPage).filter(StoryPage.story_id == story_id)
+        )
+        if page_count == 0:
              # Add a dummy page
              dummy_page = StoryPage(
                  story_id=story_id,
@@ -252,7 +265,7 @@ def seed_stories(db: Session = Depends(get_db)):
                  face_x=100, face_y=100, face_width=100, face_angle=0
              )
              db.add(dummy_page)
-             db.commit()
+             await db.commit()
 
         results.append({"title": tmpl["title"], "id": str(story_id)})
 
@@ -77,9 +77,10 @@ def generate_page(
             if remove_bg:
                 try:
                     from rembg import remove
+                    from app.services.ai.onnx_runtime import get_rembg_session
                     with open(t_in.name, 'rb') as f:
                         input_data = f.read()
-                    output_data = remove(input_data)
+                    output_data = remove(input_data, session=get_rembg_session())
                     t_out = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
                     t_out.write(output_data)
                     t_out.close()
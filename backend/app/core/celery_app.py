@@ -11,3 +11,55 @@ if redis_url.startswith("rediss://") and "ssl_cert_reqs" not in redis_url:
 celery_app.conf.broker_url = redis_url
 celery_app.conf.result_backend = redis_url
 celery_app.conf.broker_connection_retry_on_startup = True
+# Orders run for minutes: reserve one message at a time so queued orders stay
+# in the broker (visible to other workers) instead of sitting in a prefetch buffer
+celery_app.conf.worker_prefetch_multiplier = 1
+
+# Photo validation runs on its own queue, consumed by a dedicated worker process
+# (-Q validation), so uploads never wait behind a book-generation task on the
+# order worker (-Q celery). See start_free_tier.sh / render.yaml.
+celery_app.conf.task_routes = {
+    "app.worker.tasks.validate_upload": {"queue": "validation"},
+}
+
+from celery.signals import worker_process_init
+
+# Prefork children must not reuse connections opened in the parent.
+# (The worker pool profile uses NullPool; this also covers pooled overrides.)
+@worker_process_init.connect
+def _reset_db_pools(**kwargs):
+    from app.db.session import reset_after_fork
+    reset_after_fork()
+
+
+# Model warm-up: runs once per worker process (solo and prefork children), so the
+# first validation / order does not pay for model loading. Each worker only loads
+# what its queues use: validation -> detector; orders -> recognition analyzer + rembg.
+@worker_process_init.connect
+def _preload_models(**kwargs):
+    queues = set(celery_app.amqp.queues.consume_from or ())
+    print(f"--- [WORKER] Preloading AI Models for queues {sorted(queues)}... ---")
+    try:
+        if "celery" in queues:
+            # 1. Preload REMBG (u2net): character cutouts
+            from rembg import remove
+            from app.services.ai.onnx_runtime import get_rembg_session
+            import numpy as np
+            # Dummy inference to provoke download/cache
+            dummy_img = np.zeros((100, 100, 3), dtype=np.uint8)
+            remove(dummy_img, session=get_rembg_session())
+            print("[WORKER] REMBG Loaded.")
+
+            # 2. Preload InsightFace with recognition (identity + QC)
+            from app.services.ai.insight import get_app
+            get_app() # Trigger lazy load
+            print("[WORKER] InsightFace (recognition) Loaded.")
+
+        if "validation" in queues:
+            # InsightFace detector only (buffalo_s, detection)
+            from app.services.ai.insight import get_detector
+            get_detector() # Trigger lazy load
+            print("[WORKER] InsightFace (detection) Loaded.")
+    except Exception as e:
+        print(f"[WORKER] WARNING: Model preload failed: {e}")
+    print("--- [WORKER] AI Models Ready. ---")
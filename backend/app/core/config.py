@@ -31,6 +31,77 @@ class Settings(BaseSettings):
     # Frontend
     NEXT_PUBLIC_API_URL: Optional[str] = None
 
+    # ONNX Runtime (shared by rembg + InsightFace)
+    # 0 = let ONNX Runtime decide (one thread per core). When several Celery
+    # processes share a box, set INTRA_OP to cores / processes to avoid oversubscription.
+    ONNX_INTRA_OP_THREADS: int = 0
+    ONNX_INTER_OP_THREADS: int = 0
+    ONNX_GRAPH_OPTIMIZATION: str = "all" # disable | basic | extended | all
+    ONNX_ENABLE_MEM_ARENA: bool = True
+    ONNX_EXECUTION_MODE: str = "sequential" # sequential | parallel
+    ONNX_PROVIDERS: list[str] = ["CPUExecutionProvider"]
+    # Model precision: fp32 | int8 (run eval_quantization.py before switching)
+    FACE_MODEL_PRECISION: str = "fp32"
+    MATTING_MODEL_PRECISION: str = "fp32"
+
+    # Outbound HTTP (asset downloads)
+    HTTP_TIMEOUT_SECONDS: float = 60.0
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 10.0
+    HTTP_RETRIES: int = 3
+    HTTP_POOL_SIZE: int = 10
+    HTTP_MAX_DOWNLOAD_MB: int = 50
+
+    # Face Detection Resolution (adaptive, see face_analysis.choose_detection_params)
+    FACE_WORKING_MAX_EDGE: int = 1280 # Photos are downscaled to this long edge before analysis
+    FACE_MIN_FACE_FRACTION: float = 0.08 # Smallest expected face, as a fraction of the short edge
+    FACE_MIN_DET_PX: int = 20 # Min face size (px) the detector should see
+
+    # Face Analysis Cache (one InsightFace pass per image content)
+    FACE_ANALYSIS_CACHE_SIZE: int = 4 # In-process entries (hold decoded images)
+    FACE_ANALYSIS_TTL_SECONDS: int = 86400 # Redis entries (faces only)
+
+    # Identity QC (batched, per order)
+    # Off until QC_MIN_SIMILARITY is calibrated: with regeneration off, flags are only logged,
+    # and recognition on every page would be paid for nothing.
+    QC_ENABLED: bool = False
+    QC_REGENERATE: bool = False # Regenerate flagged page assets once
+    QC_MIN_SIMILARITY: float = 0.40 # Page character vs the order's master character (same style)
+    QC_OUTLIER_MAD: float = 3.0 # Robust z-score below the order median that counts as outlier
+
+    # Local Caches (content-addressed, size-bounded)
+    CACHE_DIR: str = os.path.join(os.getcwd(), "cache")
+    CLEANED_CACHE_MAX_MB: int = 512
+
+    # Upload Ingestion (streamed, see app/utils/upload_ingest.py)
+    UPLOAD_MAX_MB: int = 20
+    UPLOAD_CHUNK_BYTES: int = 1024 * 1024
+    # Upload Normalization (EXIF-rotated, capped, metadata-free working copy; original kept for print)
+    UPLOAD_WORKING_MAX_EDGE: int = 2048
+    UPLOAD_JPEG_QUALITY: int = 92
+
+    # Order Status Cache (Redis write-through, see app/services/order_cache.py)
+    ORDER_CACHE_TTL_SECONDS: int = 3600
+
+    # Book Catalog (in-memory index of assets/templates)
+    BOOK_CATALOG_REFRESH_SECONDS: int = 30 # 0 = index once at startup only
+    BOOK_THUMBNAIL_SIZE: int = 400
+
+    # Admission Control (POST /orders/create, see app/services/admission.py)
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_BACKLOG: int = 6 # Queued + running orders before new ones get 503
+    ADMISSION_MAX_PREDICTIONS: int = 8 # Concurrent Replicate predictions
+    ADMISSION_INFLIGHT_STALE_SECONDS: int = 3 * 3600
+    WORKER_CONCURRENCY: int = 1 # Orders processed in parallel (--pool=solo = 1)
+    ORDER_ESTIMATED_SECONDS: int = 600 # Initial ETA per order (then learned from completions)
+
+    # Database Connection Pools (see app/db/session.py)
+    DB_POOL_PROFILE: Optional[str] = None # api | worker | script; None = detected from the process
+    DB_TRANSACTION_POOLER: Optional[bool] = None # None = auto (Supabase pooler port 6543)
+    DB_POOL_SIZE: int = 5 # Per engine, per API process
+    DB_MAX_OVERFLOW: int = 5
+    DB_POOL_TIMEOUT_SECONDS: int = 10
+    DB_POOL_RECYCLE_SECONDS: int = 300 # Below the pooler's idle timeout (replaces pre-ping)
+
     @validator("DATABASE_URL", pre=True)
     def assemble_db_connection(cls, v: Optional[str], values: Dict[str, Any]) -> Any:
         if isinstance(v, str):
@@ -0,0 +1,33 @@
+import redis
+import redis.asyncio as aioredis
+from app.core.config import settings
+
+# Shared Redis client for app-level caching (Celery keeps its own broker connection).
+# redis-py pools are fork-aware, so one module global is safe for uvicorn and prefork workers.
+_client = None
+_async_client = None
+
+
+def _redis_url() -> str:
+    url = settings.REDIS_URL
+    # Same Upstash/Render SSL fix as celery_app (redis-py spelling)
+    if url.startswith("rediss://") and "ssl_cert_reqs" not in url:
+        url += "?ssl_cert_reqs=none"
+    return url
+
+
+def get_redis() -> redis.Redis:
+    global _client
+    if _client is not None:
+        return _client
+
+    _client = redis.Redis.from_url(_redis_url(), socket_timeout=2, socket_connect_timeout=2)
+    return _client
+
+
+def get_async_redis() -> aioredis.Redis:
+    """asyncio client for the web process (pub/sub listeners). No read timeout: subscriptions block."""
+    global _async_client
+    if _async_client is None:
+        _async_client = aioredis.Redis.from_url(_redis_url(), socket_connect_timeout=2)
+    return _async_client
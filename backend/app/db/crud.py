@@ -0,0 +1,62 @@
+import uuid
+from typing import Optional
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+from app.db.models import Order, OrderPage
+
+# Session.info key listing orders changed through Core statements (no ORM objects),
+# so session listeners (e.g. the order cache write-through) still see them.
+TOUCHED_ORDERS_KEY = "touched_orders"
+# Session.info key: {order_id: {page_number: image_url}} for orders whose pages a
+# listener tracks in memory; Core page writes keep it current.
+PAGE_URLS_KEY = "order_page_urls"
+
+
+def upsert_order_page(db: Session, order_id, page_number: int, image_url: str) -> Optional[str]:
+    """
+    Inserts or updates a generated page in one round-trip:
+    INSERT ... ON CONFLICT (order_id, page_number) DO UPDATE, plus the Order.version
+    bump in the same statement (the new version is set on the Order if it is loaded).
+    Safe for concurrent page workers.
+    Returns the previous image_url (None if the page is new). Caller commits.
+    """
+    previous_page = aliased(OrderPage)
+    previous = select(previous_page.image_url).where(
+        previous_page.order_id == order_id,
+        previous_page.page_number == page_number
+    ).cte("previous")
+
+    bump = update(Order).where(Order.id == order_id).values(
+        version=Order.version + 1
+    ).returning(Order.version).cte("bump")
+
+    stmt = pg_insert(OrderPage).values(
+        id=uuid.uuid4(),
+        order_id=order_id,
+        page_number=page_number,
+        image_url=image_url
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[OrderPage.order_id, OrderPage.page_number],
+        set_={"image_url": stmt.excluded.image_url}
+    ).returning(
+        # RETURNING subqueries see the snapshot from before this statement
+        select(previous.c.image_url).scalar_subquery(),
+        select(bump.c.version).scalar_subquery()
+    ).add_cte(previous).add_cte(bump)
+
+    previous_url, version = db.execute(stmt).one()
+
+    # Keep a loaded Order in step with the bump (listeners snapshot it at commit)
+    order = db.identity_map.get(identity_key(Order, order_id))
+    if order is not None and version is not None:
+        set_committed_value(order, "version", version)
+
+    db.info.setdefault(TOUCHED_ORDERS_KEY, set()).add(order_id)
+    tracked = db.info.get(PAGE_URLS_KEY, {}).get(order_id)
+    if tracked is not None:
+        tracked[page_number] = image_url
+    return previous_url
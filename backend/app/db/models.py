@@ -1,8 +1,9 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, DateTime, Text, Enum, Integer, Float, ForeignKey
+from sqlalchemy import Column, String, DateTime, Text, Enum, Integer, Float, ForeignKey, LargeBinary, JSON, UniqueConstraint, Index
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import DeclarativeBase, relationship
+from sqlalchemy import event
+from sqlalchemy.orm import DeclarativeBase, Session, relationship
 import enum
 
 class Base(DeclarativeBase):
@@ -50,6 +51,12 @@ class StoryPage(Base):
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        # Keyset pagination (newest first), optionally filtered by status or story
+        Index("ix_orders_created_at_id", "created_at", "id"),
+        Index("ix_orders_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_orders_story_created_at_id", "story_id", "created_at", "id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     status = Column(Enum(OrderStatus), default=OrderStatus.DRAFT, nullable=False)
@@ -70,6 +77,9 @@ class Order(Base):
     pdf_url = Column(String, nullable=True)
     
     failure_reason = Column(Text, nullable=True)
+
+    # Bumped on every change to the order or its pages (status endpoint ETag)
+    version = Column(Integer, default=0, nullable=False)
     
     
     # Relationship
@@ -79,6 +89,7 @@ class Order(Base):
 class OrderPage(Base):
     """Represents a generated page for a specific order"""
     __tablename__ = "order_pages"
+    __table_args__ = (UniqueConstraint("order_id", "page_number", name="uq_order_pages_order_page"),)
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     order_id = Column(UUID(as_uuid=True), ForeignKey("orders.id"), nullable=False)
@@ -86,3 +97,55 @@ class OrderPage(Base):
     image_url = Column(String, nullable=False)
     
     order = relationship("Order", back_populates="generated_pages")
+
+@event.listens_for(Session, "before_flush")
+def _bump_order_version(session, flush_context, instances):
+    """
+    Increments Order.version whenever the order row or one of its pages changes,
+    so pollers can tell "nothing changed" from the order row alone.
+    """
+    touched = set()
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Order) and obj not in session.new and session.is_modified(obj):
+            touched.add(obj)
+        elif isinstance(obj, OrderPage) and (obj in session.new or session.is_modified(obj)):
+            order = obj.order if "order" in obj.__dict__ else session.get(Order, obj.order_id)
+            if order is not None and order not in session.new:
+                touched.add(order)
+    for order in touched:
+        order.version = Order.version + 1
+
+class FaceEmbedding(Base):
+    """Normalized face embeddings per image content hash (user uploads + generated masters)"""
+    __tablename__ = "face_embeddings"
+    __table_args__ = (UniqueConstraint("image_hash", "face_index", name="uq_face_embeddings_hash_index"),)
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    image_hash = Column(String(64), nullable=False, index=True) # SHA-256 of the image bytes
+    face_index = Column(Integer, nullable=False) # 0 = largest face
+    kind = Column(String, nullable=False) # 'upload' | 'master'
+    embedding = Column(LargeBinary, nullable=True) # float32[512], L2-normalized
+    bbox = Column(JSON, nullable=False) # [x1, y1, x2, y2]
+    det_score = Column(Float, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class StoredUpload(Base):
+    """A user photo stored once under its content hash, plus everything derived from it"""
+    __tablename__ = "stored_uploads"
+
+    content_hash = Column(String(64), primary_key=True) # SHA-256 of the uploaded bytes
+    path = Column(String, nullable=False) # uploads/blobs/{hash}{ext}
+    format = Column(String, nullable=False) # jpeg | png | webp
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, default=0, nullable=False) # Number of UploadRefs pointing here
+    validation = Column(JSON, nullable=True) # Cached validator result
+    artifacts = Column(JSON, nullable=True) # {"master:{book_id}:{role}": path, ...}
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class UploadRef(Base):
+    """Maps an upload_id (one per upload request) to its stored content"""
+    __tablename__ = "upload_refs"
+
+    upload_id = Column(String, primary_key=True)
+    content_hash = Column(String(64), ForeignKey("stored_uploads.content_hash"), nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
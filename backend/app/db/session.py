@@ -1,9 +1,97 @@
-from sqlalchemy import create_engine
+import os
+import sys
+import uuid
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from app.core.config import settings
 
+# Connection pool profiles, selected by process role (DB_POOL_PROFILE, else detected):
+#   api    - uvicorn: bounded QueuePool, recycled connections, no pre-ping round-trip
+#   worker - Celery: NullPool (no sockets inherited across prefork, nothing idle
+#            between tasks); the Supabase pooler does the pooling server-side
+#   script - one-off scripts / shells: small pool with pre-ping (long idle gaps)
+# On the transaction pooler (port 6543 or DB_TRANSACTION_POOLER) connections are
+# shared per transaction, so prepared statements are disabled and nothing relies
+# on session state.
+
+POOL_PROFILES = ("api", "worker", "script")
+
+
+def process_role() -> str:
+    if settings.DB_POOL_PROFILE:
+        if settings.DB_POOL_PROFILE not in POOL_PROFILES:
+            raise ValueError(f"DB_POOL_PROFILE must be one of {POOL_PROFILES}")
+        return settings.DB_POOL_PROFILE
+    argv = " ".join(sys.argv).lower()
+    if "celery" in argv:
+        return "worker"
+    if "uvicorn" in argv or "gunicorn" in argv:
+        return "api"
+    return "script"
+
+
+def is_transaction_pooler(url) -> bool:
+    if settings.DB_TRANSACTION_POOLER is not None:
+        return settings.DB_TRANSACTION_POOLER
+    return url.port == 6543
+
+
+def _pool_args(profile: str) -> dict:
+    if profile == "worker":
+        return {"poolclass": NullPool}
+    if profile == "api":
+        return {
+            "pool_size": settings.DB_POOL_SIZE,
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+            "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+            "pool_pre_ping": False,
+        }
+    return {"pool_size": 2, "max_overflow": 2, "pool_pre_ping": True}
+
+
+def _engine_args(url, profile: str) -> dict:
+    if not url.drivername.startswith("postgres"):
+        return {} # sqlite etc. (local checks): driver defaults
+    return _pool_args(profile)
+
+
+def _sync_connect_args(url) -> dict:
+    # psycopg2 never prepares server-side; psycopg 3 does after a few executions
+    if url.drivername == "postgresql+psycopg" and is_transaction_pooler(url):
+        return {"prepare_threshold": None}
+    return {}
+
+
+_pool_counters = {}
+
+
+def _instrument(sync_engine, name: str) -> None:
+    counters = _pool_counters.setdefault(name, {"connects": 0, "checkouts": 0, "invalidations": 0})
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        counters["connects"] += 1
+
+    @event.listens_for(sync_engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        counters["checkouts"] += 1
+
+    @event.listens_for(sync_engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        counters["invalidations"] += 1
+
+
+POOL_PROFILE = process_role()
+
 # Create SQLAlchemy engine
-engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
+# Sync engine: Celery workers, upload store (API threadpool), startup create_all and scripts
+_db_url = make_url(settings.DATABASE_URL)
+engine = create_engine(_db_url, connect_args=_sync_connect_args(_db_url), **_engine_args(_db_url, POOL_PROFILE))
+_instrument(engine, "sync")
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -15,3 +103,67 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def _async_url(url: str):
+    """postgresql:// (psycopg2) -> postgresql+asyncpg://, translating libpq-only query args."""
+    u = make_url(url)
+    if not u.drivername.startswith("postgres"):
+        return u
+    query = dict(u.query)
+    sslmode = query.pop("sslmode", None)
+    if sslmode and "ssl" not in query:
+        query["ssl"] = sslmode
+    return u.set(drivername="postgresql+asyncpg", query=query)
+
+
+def _async_connect_args(url) -> dict:
+    # Supabase transaction pooler (pgbouncer) cannot keep prepared statements across transactions:
+    # no statement cache, and unique names for the unnamed statements asyncpg still prepares
+    if url.drivername == "postgresql+asyncpg" and is_transaction_pooler(url):
+        return {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    return {}
+
+
+# Async engine: API request handlers (no threadpool slot held while waiting on Postgres)
+_async_db_url = _async_url(settings.DATABASE_URL)
+async_engine = create_async_engine(
+    _async_db_url,
+    connect_args=_async_connect_args(_async_db_url),
+    **_engine_args(_async_db_url, POOL_PROFILE)
+)
+_instrument(async_engine.sync_engine, "async")
+
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Dependency to get async DB session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def reset_after_fork() -> None:
+    """Called in a freshly forked child: drop the parent's pooled connections without closing them."""
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+
+
+def pool_stats() -> dict:
+    """Pool occupancy + lifetime counters per engine (GET /health/db)."""
+    stats = {"profile": POOL_PROFILE, "pid": os.getpid(), "engines": {}}
+    for name, eng in (("sync", engine), ("async", async_engine.sync_engine)):
+        pool = eng.pool
+        entry = {"pool": type(pool).__name__, **_pool_counters.get(name, {})}
+        if hasattr(pool, "checkedout"):
+            entry.update({
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+            })
+        stats["engines"][name] = entry
+    return stats
@@ -1,7 +1,9 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from app.utils.static_files import CachedStaticFiles
 from app.core.config import settings
+from app.utils.upload_ingest import max_upload_bytes
 import os
 
 app = FastAPI(title=settings.PROJECT_NAME)
@@ -11,13 +13,13 @@ static_dir = os.path.join(os.path.dirname(__file__), "static")
 if not os.path.exists(static_dir):
     os.makedirs(static_dir)
 
-app.mount("/static", StaticFiles(directory=static_dir), name="static")
+app.mount("/static", CachedStaticFiles(directory=static_dir), name="static")
 
 # Mount uploads directory for generated files
 uploads_dir = os.path.join(os.getcwd(), "uploads")
 if not os.path.exists(uploads_dir):
     os.makedirs(uploads_dir)
-app.mount("/uploads", StaticFiles(directory=uploads_dir), name="uploads")
+app.mount("/uploads", CachedStaticFiles(directory=uploads_dir), name="uploads")
 
 from app.db.session import engine
 from app.db.models import Base
@@ -25,31 +27,12 @@ from app.db.models import Base
 @app.on_event("startup")
 def on_startup():
     Base.metadata.create_all(bind=engine)
-    
-    # -------------------------------------------------------------
-    # PRELOAD AI MODELS
-    # -------------------------------------------------------------
-    print("--- [STARTUP] Preloading AI Models... ---")
-    try:
-        # 1. Preload REMBG (u2net)
-        print("[STARTUP] Loading REMBG (u2net)...")
-        from rembg import remove, new_session
-        import numpy as np
-        # Dummy inference to provoke download/cache
-        dummy_img = np.zeros((100, 100, 3), dtype=np.uint8)
-        remove(dummy_img) 
-        print("[STARTUP] REMBG Loaded.")
-        
-        # 2. Preload InsightFace (buffalo_s)
-        print("[STARTUP] Loading InsightFace (buffalo_s)...")
-        from app.services.ai.insight import get_app
-        get_app() # Trigger lazy load
-        print("[STARTUP] InsightFace Loaded.")
-        
-    except Exception as e:
-        print(f"[STARTUP] WARNING: Model preload failed: {e}")
-    print("--- [STARTUP] AI Models Ready. ---")
 
+    # Book catalog: indexed once here, rebuilt in the background when templates change
+    from app.services.book_catalog import catalog
+    catalog.start()
+
+    # AI models are loaded by the Celery workers (validation + generation), not the web process
 
 from app.api.v1 import orders, stories, ai, test, books
 
@@ -77,8 +60,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"], # Status polling (If-None-Match), order list pagination
 )
 
+# Reject oversized uploads from the Content-Length header, before the body is read.
+# Bodies without a length are capped by the endpoint as it streams them
+# (upload_ingest.ingest_request).
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    if request.method == "POST" and request.url.path.endswith("/orders/upload"):
+        content_length = request.headers.get("content-length")
+        # Small allowance for the multipart envelope
+        if content_length and content_length.isdigit() and int(content_length) > max_upload_bytes() + 64 * 1024:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"File too large (max {settings.UPLOAD_MAX_MB}MB)."}
+            )
+    return await call_next(request)
+
 @app.get("/")
 def read_root():
     return {"message": "PickaBook API is running"}
@@ -86,3 +85,8 @@ def read_root():
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
+
+@app.get("/health/db")
+def db_pool_health():
+    from app.db.session import pool_stats
+    return pool_stats()
@@ -38,3 +38,6 @@ class OrderResponse(BaseModel):
 class OrderStatusSchema(BaseModel):
     id: UUID
     status: OrderStatus
+    completed_pages: int = 0
+    version: int = 0
+    failure_reason: Optional[str] = None
@@ -0,0 +1,142 @@
+import math
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+# Admission control for POST /orders/create.
+# Capacity is read from Redis, where the broker already lives:
+#   - admitted orders: sorted set of every order admitted and not finished yet
+#     (queued, reserved by a worker, or running), entered at admission time
+#   - queue depth: length of the Celery default queue (reported only; prefetched
+#     messages leave this list before their task starts)
+#   - in-flight predictions: counter around Replicate calls
+# Check and reservation are one Lua script, so concurrent requests cannot all pass.
+# The ETA uses an EWMA of recent order durations. Redis errors fail open.
+
+CELERY_QUEUE = "celery"
+_INFLIGHT_ORDERS_KEY = "admission:inflight_orders"
+_INFLIGHT_PREDICTIONS_KEY = "admission:inflight_predictions"
+_AVG_SECONDS_KEY = "admission:avg_order_seconds"
+_EWMA_ALPHA = 0.3
+
+# Drop stale entries, then admit (ZADD) only if both limits allow it.
+# Returns {admitted, orders_ahead, predictions}.
+_ADMIT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, ARGV[1])
+local backlog = redis.call('ZCARD', KEYS[1])
+local predictions = tonumber(redis.call('GET', KEYS[2]) or '0')
+if backlog >= tonumber(ARGV[3]) or predictions >= tonumber(ARGV[4]) then
+    return {0, backlog, predictions}
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[5])
+return {1, backlog, predictions}
+"""
+
+
+@dataclass
+class AdmissionDecision:
+    admitted: bool
+    queue_depth: int = 0
+    in_flight_orders: int = 0 # Admitted orders ahead of this one (queued + reserved + running)
+    in_flight_predictions: int = 0
+    eta_seconds: int = 0 # Expected time until a newly admitted order completes
+    retry_after: int = 0 # Seconds until a slot is likely to free up (rejections only)
+    reason: str = ""
+
+
+def average_order_seconds() -> float:
+    try:
+        raw = get_redis().get(_AVG_SECONDS_KEY)
+        return float(raw) if raw else float(settings.ORDER_ESTIMATED_SECONDS)
+    except Exception:
+        return float(settings.ORDER_ESTIMATED_SECONDS)
+
+
+def admit(order_id) -> AdmissionDecision:
+    """
+    Atomically checks capacity and, if admitted, records `order_id` as admitted.
+    The caller must call order_finished(order_id) if the order is then not enqueued.
+    """
+    if not settings.ADMISSION_ENABLED:
+        return AdmissionDecision(admitted=True)
+
+    try:
+        r = get_redis()
+        now = time.time()
+        admitted, backlog, in_flight_predictions = r.eval(
+            _ADMIT, 2, _INFLIGHT_ORDERS_KEY, _INFLIGHT_PREDICTIONS_KEY,
+            now - settings.ADMISSION_INFLIGHT_STALE_SECONDS, now,
+            settings.ADMISSION_MAX_BACKLOG, settings.ADMISSION_MAX_PREDICTIONS, str(order_id)
+        )
+        queue_depth = r.llen(CELERY_QUEUE)
+        in_flight_predictions = max(0, int(in_flight_predictions or 0))
+    except Exception as e:
+        print(f"[Admission] Capacity check skipped: {e}")
+        return AdmissionDecision(admitted=True)
+
+    avg_seconds = average_order_seconds()
+    concurrency = max(1, settings.WORKER_CONCURRENCY)
+    # This order runs after ceil((backlog + 1) / concurrency) "rounds" of average orders
+    eta_seconds = int(math.ceil((backlog + 1) / concurrency) * avg_seconds)
+
+    reason = ""
+    if not admitted:
+        if backlog >= settings.ADMISSION_MAX_BACKLOG:
+            reason = f"{backlog} orders ahead (limit {settings.ADMISSION_MAX_BACKLOG})"
+        else:
+            reason = f"{in_flight_predictions} AI generations running (limit {settings.ADMISSION_MAX_PREDICTIONS})"
+
+    retry_after = 0
+    if reason:
+        # Roughly when the oldest running order finishes and a slot frees up
+        retry_after = int(min(max(avg_seconds / concurrency, 30), 900))
+
+    return AdmissionDecision(
+        admitted=bool(admitted),
+        queue_depth=queue_depth,
+        in_flight_orders=backlog,
+        in_flight_predictions=in_flight_predictions,
+        eta_seconds=eta_seconds,
+        retry_after=retry_after,
+        reason=reason
+    )
+
+
+def order_started(order_id: str) -> None:
+    """Restarts the staleness clock when a worker picks the order up."""
+    try:
+        get_redis().zadd(_INFLIGHT_ORDERS_KEY, {str(order_id): time.time()})
+    except Exception as e:
+        print(f"[Admission] order_started skipped: {e}")
+
+
+def order_finished(order_id: str, duration_seconds: float = None) -> None:
+    try:
+        r = get_redis()
+        r.zrem(_INFLIGHT_ORDERS_KEY, str(order_id))
+        if duration_seconds:
+            avg = average_order_seconds()
+            r.set(_AVG_SECONDS_KEY, _EWMA_ALPHA * duration_seconds + (1 - _EWMA_ALPHA) * avg)
+    except Exception as e:
+        print(f"[Admission] order_finished skipped: {e}")
+
+
+@contextmanager
+def prediction_slot():
+    """Counts a running Replicate prediction for the duration of the block."""
+    counted = False
+    try:
+        get_redis().incr(_INFLIGHT_PREDICTIONS_KEY)
+        counted = True
+    except Exception as e:
+        print(f"[Admission] Prediction counter skipped: {e}")
+    try:
+        yield
+    finally:
+        if counted:
+            try:
+                get_redis().decr(_INFLIGHT_PREDICTIONS_KEY)
+            except Exception:
+                pass
@@ -0,0 +1,85 @@
+import hashlib
+from typing import List, Optional
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+from app.db.session import SessionLocal
+from app.db.models import FaceEmbedding
+from app.services.ai import face_analysis
+from app.services.ai.face_analysis import DetectedFace, FaceAnalysisResult
+
+# Persistent face embeddings keyed by image content hash.
+# The source side of QC (user upload / master character) is identical for every page
+# of an order, so it is analyzed once, stored here, and each page check only analyzes
+# the new image. Similarity is a dot product of L2-normalized embeddings.
+
+
+def load(image_hash: str) -> Optional[List[DetectedFace]]:
+    """Returns stored faces (largest first) or None if this image was never stored."""
+    db = SessionLocal()
+    try:
+        rows = db.query(FaceEmbedding).filter(
+            FaceEmbedding.image_hash == image_hash
+        ).order_by(FaceEmbedding.face_index).all()
+        if not rows:
+            return None
+        return [
+            DetectedFace(
+                bbox=np.asarray(row.bbox, dtype=np.float32),
+                kps=None,
+                det_score=row.det_score or 0.0,
+                embedding=np.frombuffer(row.embedding, dtype=np.float32) if row.embedding else None,
+            )
+            for row in rows
+        ]
+    finally:
+        db.close()
+
+
+def save(analysis: FaceAnalysisResult, kind: str) -> None:
+    """Stores all faces of an analysis (idempotent per image hash)."""
+    if not analysis.faces:
+        return
+
+    db = SessionLocal()
+    try:
+        for index, face in enumerate(analysis.sorted_faces()):
+            db.add(FaceEmbedding(
+                image_hash=analysis.content_hash,
+                face_index=index,
+                kind=kind,
+                embedding=face.embedding.astype(np.float32).tobytes() if face.embedding is not None else None,
+                bbox=[float(v) for v in face.bbox],
+                det_score=face.det_score,
+            ))
+        db.commit()
+    except IntegrityError:
+        # Another process stored the same image first
+        db.rollback()
+    finally:
+        db.close()
+
+
+def get_or_compute(source: str, kind: str = "upload") -> List[DetectedFace]:
+    """Faces for a source image, from the store if present, else analyzed once and stored."""
+    data = face_analysis.read_source_bytes(source)
+    image_hash = hashlib.sha256(data).hexdigest()
+
+    try:
+        faces = load(image_hash)
+        if faces is not None:
+            return faces
+    except Exception as e:
+        print(f"[EmbeddingStore] Lookup skipped: {e}")
+
+    analysis = face_analysis.analyze_bytes(data)
+    try:
+        save(analysis, kind)
+    except Exception as e:
+        print(f"[EmbeddingStore] Save skipped: {e}")
+    return analysis.sorted_faces()
+
+
+def similarity(a: Optional[DetectedFace], b: Optional[DetectedFace]) -> float:
+    if a is None or b is None or a.embedding is None or b.embedding is None:
+        return 0.0
+    return float(np.dot(a.embedding, b.embedding))
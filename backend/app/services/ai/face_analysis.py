@@ -0,0 +1,289 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional
+from urllib.parse import unquote
+import cv2
+import numpy as np
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.utils import http_client
+import app.services.ai.insight as insight_service
+
+# One InsightFace pass per image content.
+# Validation, identity extraction and QC all consume the same FaceAnalysisResult,
+# cached in-process (with the decoded image) and in Redis (faces only, no pixels).
+
+_REDIS_PREFIX = "face_analysis:v2"
+
+# In-process LRU: content_hash -> FaceAnalysisResult
+_memory_cache = OrderedDict()
+
+
+@dataclass
+class DetectedFace:
+    bbox: np.ndarray # [x1, y1, x2, y2] in original image coordinates
+    kps: Optional[np.ndarray] # 5 landmarks
+    det_score: float
+    embedding: Optional[np.ndarray] # L2-normalized (cosine similarity = dot product)
+    gender: Optional[int] = None
+    age: Optional[int] = None
+
+    @property
+    def area(self) -> float:
+        return float((self.bbox[2] - self.bbox[0]) * (self.bbox[3] - self.bbox[1]))
+
+    def to_dict(self) -> dict:
+        return {
+            "bbox": self.bbox.tolist(),
+            "kps": self.kps.tolist() if self.kps is not None else None,
+            "det_score": self.det_score,
+            "embedding": self.embedding.tolist() if self.embedding is not None else None,
+            "gender": self.gender,
+            "age": self.age,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DetectedFace":
+        return cls(
+            bbox=np.asarray(data["bbox"], dtype=np.float32),
+            kps=np.asarray(data["kps"], dtype=np.float32) if data.get("kps") is not None else None,
+            det_score=data["det_score"],
+            embedding=np.asarray(data["embedding"], dtype=np.float32) if data.get("embedding") is not None else None,
+            gender=data.get("gender"),
+            age=data.get("age"),
+        )
+
+    @classmethod
+    def from_insightface(cls, face) -> "DetectedFace":
+        embedding = None
+        if getattr(face, "embedding", None) is not None:
+            embedding = face.normed_embedding
+        gender = getattr(face, "gender", None)
+        age = getattr(face, "age", None)
+        return cls(
+            bbox=np.asarray(face.bbox, dtype=np.float32),
+            kps=np.asarray(face.kps, dtype=np.float32) if getattr(face, "kps", None) is not None else None,
+            det_score=float(face.det_score),
+            embedding=np.asarray(embedding, dtype=np.float32) if embedding is not None else None,
+            gender=int(gender) if gender is not None else None,
+            age=int(age) if age is not None else None,
+        )
+
+
+@dataclass
+class FaceAnalysisResult:
+    content_hash: str
+    width: int
+    height: int
+    faces: List[DetectedFace] = field(default_factory=list)
+    has_embeddings: bool = False # False when produced by the detection-only analyzer
+    image: Optional[np.ndarray] = None # Decoded BGR image (not persisted to Redis)
+
+    @property
+    def face_count(self) -> int:
+        return len(self.faces)
+
+    def sorted_faces(self) -> List[DetectedFace]:
+        """Largest face first (same ordering the pipeline has always used for face_index)."""
+        return sorted(self.faces, key=lambda f: f.area, reverse=True)
+
+    def primary_face(self) -> Optional[DetectedFace]:
+        faces = self.sorted_faces()
+        return faces[0] if faces else None
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "content_hash": self.content_hash,
+            "width": self.width,
+            "height": self.height,
+            "faces": [f.to_dict() for f in self.faces],
+            "has_embeddings": self.has_embeddings,
+        })
+
+    @classmethod
+    def from_json(cls, raw) -> "FaceAnalysisResult":
+        data = json.loads(raw)
+        return cls(
+            content_hash=data["content_hash"],
+            width=data["width"],
+            height=data["height"],
+            faces=[DetectedFace.from_dict(f) for f in data["faces"]],
+            has_embeddings=data.get("has_embeddings", True),
+        )
+
+
+def read_source_bytes(source: str) -> bytes:
+    """Reads file://, http(s):// or plain local paths."""
+    if not isinstance(source, str):
+        source = str(source)
+    if source.startswith("http://") or source.startswith("https://"):
+        return http_client.download_bytes(source)
+    path = source
+    if source.startswith("file://"):
+        path = unquote(source[7:])
+        if os.name == 'nt' and path.startswith('/'):
+            path = path[1:]
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def decode_image(data: bytes) -> Optional[np.ndarray]:
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def _cache_key(content_hash: str) -> str:
+    # Model precision changes detections/embeddings, so it is part of the key
+    return f"{_REDIS_PREFIX}:{settings.FACE_MODEL_PRECISION}:{content_hash}"
+
+
+def _remember(result: FaceAnalysisResult):
+    _memory_cache[result.content_hash] = result
+    _memory_cache.move_to_end(result.content_hash)
+    while len(_memory_cache) > settings.FACE_ANALYSIS_CACHE_SIZE:
+        _memory_cache.popitem(last=False)
+
+
+def _redis_get(content_hash: str) -> Optional[FaceAnalysisResult]:
+    try:
+        raw = get_redis().get(_cache_key(content_hash))
+        return FaceAnalysisResult.from_json(raw) if raw else None
+    except Exception as e:
+        print(f"[FaceAnalysis] Redis read skipped: {e}")
+        return None
+
+
+def _redis_set(result: FaceAnalysisResult):
+    try:
+        get_redis().set(_cache_key(result.content_hash), result.to_json(), ex=settings.FACE_ANALYSIS_TTL_SECONDS)
+    except Exception as e:
+        print(f"[FaceAnalysis] Redis write skipped: {e}")
+
+
+def _add_embeddings(result: FaceAnalysisResult):
+    """
+    Upgrades a detection-only result: runs recognition + gender/age on the already
+    detected faces (needs bbox + kps only), without a second detector pass.
+    """
+    from insightface.app.common import Face
+
+    model = insight_service.get_app()
+    if model is None:
+        raise RuntimeError("InsightFace app failed to load.")
+
+    upgraded = []
+    for detected in result.faces:
+        face = Face(bbox=detected.bbox, kps=detected.kps, det_score=detected.det_score)
+        for task_name, task_model in model.models.items():
+            if task_name == "detection":
+                continue
+            task_model.get(result.image, face)
+        upgraded.append(DetectedFace.from_insightface(face))
+    result.faces = upgraded
+    result.has_embeddings = True
+
+
+def choose_detection_params(width: int, height: int) -> tuple:
+    """
+    Picks (working_scale, det_size) from the image dimensions and the expected face scale.
+    - working_scale caps the long edge at FACE_WORKING_MAX_EDGE (a 12MP photo is never fed raw).
+    - det_size is the smallest square input (multiple of 32, 320..640) at which the smallest
+      expected face (FACE_MIN_FACE_FRACTION of the short edge) still spans FACE_MIN_DET_PX.
+    Both are bounded, so latency stays roughly constant regardless of upload size.
+    """
+    long_edge, short_edge = max(width, height), min(width, height)
+    working_scale = min(1.0, settings.FACE_WORKING_MAX_EDGE / long_edge)
+
+    # The detector letterboxes the long edge to det_size
+    needed = settings.FACE_MIN_DET_PX * long_edge / (settings.FACE_MIN_FACE_FRACTION * short_edge)
+    det_side = int(np.ceil(needed / 32.0) * 32)
+    det_side = max(320, min(640, det_side))
+    return working_scale, (det_side, det_side)
+
+
+def detect_faces(model, img: np.ndarray, run_tasks: bool = True) -> List[DetectedFace]:
+    """
+    FaceAnalysis.get() with an adaptive detector input and a pre-downscaled working image.
+    Boxes and landmarks are mapped back to original image coordinates.
+    run_tasks=False skips recognition/gender-age (e.g. batched QC embeds crops itself).
+    """
+    from insightface.app.common import Face
+
+    height, width = img.shape[:2]
+    working_scale, det_size = choose_detection_params(width, height)
+    work = img
+    if working_scale < 1.0:
+        work = cv2.resize(img, None, fx=working_scale, fy=working_scale, interpolation=cv2.INTER_AREA)
+
+    bboxes, kpss = model.det_model.detect(work, input_size=det_size, max_num=0, metric='default')
+
+    faces = []
+    for i in range(bboxes.shape[0]):
+        face = Face(bbox=bboxes[i, 0:4], kps=kpss[i] if kpss is not None else None, det_score=bboxes[i, 4])
+        if run_tasks:
+            for task_name, task_model in model.models.items():
+                if task_name == "detection":
+                    continue
+                task_model.get(work, face)
+
+        detected = DetectedFace.from_insightface(face)
+        detected.bbox = detected.bbox / working_scale
+        if detected.kps is not None:
+            detected.kps = detected.kps / working_scale
+        faces.append(detected)
+    return faces
+
+
+def analyze_bytes(data: bytes, with_embeddings: bool = True) -> FaceAnalysisResult:
+    """
+    Runs (or reuses) the face analysis for an encoded image.
+    with_embeddings=False uses the detection-only analyzer (validation); a later call
+    with embeddings upgrades the cached result instead of re-detecting.
+    """
+    content_hash = hashlib.sha256(data).hexdigest()
+
+    # 1. In-process (has the decoded image)
+    cached = _memory_cache.get(content_hash)
+    if cached is not None:
+        _memory_cache.move_to_end(content_hash)
+    else:
+        # 2. Redis (faces only; decoding is cheap compared to detection)
+        cached = _redis_get(content_hash)
+        if cached is not None:
+            cached.image = decode_image(data)
+            _remember(cached)
+
+    if cached is not None:
+        if with_embeddings and not cached.has_embeddings:
+            _add_embeddings(cached)
+            _redis_set(cached)
+        return cached
+
+    # 3. Compute
+    img = decode_image(data)
+    if img is None:
+        raise ValueError("Could not decode image.")
+
+    model = insight_service.get_app() if with_embeddings else insight_service.get_detector()
+    if model is None:
+        raise RuntimeError("InsightFace app failed to load.")
+
+    faces = detect_faces(model, img)
+    result = FaceAnalysisResult(
+        content_hash=content_hash,
+        width=int(img.shape[1]),
+        height=int(img.shape[0]),
+        faces=faces,
+        has_embeddings=with_embeddings,
+        image=img,
+    )
+    _remember(result)
+    _redis_set(result)
+    return result
+
+
+def analyze(source: str, with_embeddings: bool = True) -> FaceAnalysisResult:
+    """Face analysis for a file://, http(s):// or local path source."""
+    return analyze_bytes(read_source_bytes(source), with_embeddings=with_embeddings)
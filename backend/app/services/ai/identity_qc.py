@@ -0,0 +1,118 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import cv2
+import numpy as np
+from app.core.config import settings
+from app.services.ai import embedding_store, face_analysis
+import app.services.ai.insight as insight_service
+
+# Batched identity QC for a whole order.
+# Page characters are compared with the order's master characters (same illustrated
+# style), not with the user photo. Detection runs per page asset, but all face crops
+# go through the recognition model in one batch, and similarity against the (stored)
+# master embeddings is a single matrix product. Only outliers are flagged for
+# regeneration; assets without a detectable face are reported but not flagged.
+
+
+@dataclass
+class PageAsset:
+    page_id: str
+    role: str
+    path: str
+
+
+@dataclass
+class QCResult:
+    asset: PageAsset
+    score: float # Cosine similarity to the role's master face (0.0 if no face found)
+    flagged: bool
+    reason: str = ""
+
+
+def _embed_batch(rec_model, crops: List[np.ndarray]) -> np.ndarray:
+    """Normalized embeddings for aligned 112x112 crops, one recognition call for the batch."""
+    try:
+        feats = rec_model.get_feat(crops)
+    except Exception as e:
+        # Recognition model exported with a fixed batch of 1
+        print(f"[QC] Batched recognition unavailable ({e}). Falling back to per-crop.")
+        feats = np.concatenate([rec_model.get_feat([crop]) for crop in crops], axis=0)
+    feats = np.asarray(feats, dtype=np.float32).reshape(len(crops), -1)
+    return feats / np.linalg.norm(feats, axis=1, keepdims=True).clip(min=1e-8)
+
+
+def run_batch_qc(source_paths: Dict[str, str], assets: List[PageAsset], source_kind: str = "master") -> List[QCResult]:
+    """
+    source_paths: role -> master character path. Embeddings come from the embedding store
+    (stored as kind="master" when the master is generated).
+    assets: generated page characters to check.
+    """
+    if not assets:
+        return []
+
+    from insightface.utils import face_align
+
+    model = insight_service.get_app()
+    if model is None:
+        print("[QC] InsightFace app failed to load. Skipping QC.")
+        return [QCResult(asset=a, score=0.0, flagged=False, reason="qc_unavailable") for a in assets]
+
+    # 1. Source embeddings (one row per role)
+    roles = sorted({a.role for a in assets if a.role in source_paths})
+    source_rows = []
+    for role in roles:
+        faces = embedding_store.get_or_compute(source_paths[role], kind=source_kind)
+        source_rows.append(faces[0].embedding if faces and faces[0].embedding is not None else None)
+    role_index = {role: i for i, role in enumerate(roles) if source_rows[i] is not None}
+    if not role_index:
+        print("[QC] No master embeddings available. Skipping QC.")
+        return [QCResult(asset=a, score=0.0, flagged=False, reason="no_source_face") for a in assets]
+    dim = next(r for r in source_rows if r is not None).shape[0]
+    source_matrix = np.stack([r if r is not None else np.zeros(dim, dtype=np.float32) for r in source_rows])
+
+    # 2. Detect + align the largest face in every asset
+    crops, crop_owner = [], []
+    results: List[Optional[QCResult]] = [None] * len(assets)
+    for i, asset in enumerate(assets):
+        if asset.role not in role_index:
+            results[i] = QCResult(asset=asset, score=0.0, flagged=False, reason="no_source_face")
+            continue
+        img = cv2.imread(asset.path, cv2.IMREAD_COLOR)
+        if img is None:
+            results[i] = QCResult(asset=asset, score=0.0, flagged=True, reason="unreadable")
+            continue
+        faces = face_analysis.detect_faces(model, img, run_tasks=False)
+        faces = sorted(faces, key=lambda f: f.area, reverse=True)
+        if not faces or faces[0].kps is None:
+            # Common on illustrated bodies (profile, hair over face); not evidence of a wrong identity
+            results[i] = QCResult(asset=asset, score=0.0, flagged=False, reason="no_face")
+            continue
+        crops.append(face_align.norm_crop(img, landmark=faces[0].kps, image_size=112))
+        crop_owner.append(i)
+
+    # 3. One recognition batch + one similarity matrix (assets x roles)
+    if crops:
+        rec_model = model.models["recognition"]
+        embeddings = _embed_batch(rec_model, crops)
+        sim_matrix = embeddings @ source_matrix.T
+        scores = np.array([
+            sim_matrix[row, role_index[assets[owner].role]] for row, owner in enumerate(crop_owner)
+        ])
+
+        # Outliers: below the absolute floor, or far below the order's own median (robust z-score)
+        median = float(np.median(scores))
+        mad = float(np.median(np.abs(scores - median))) or 1e-6
+        for row, owner in enumerate(crop_owner):
+            score = float(scores[row])
+            if score < settings.QC_MIN_SIMILARITY:
+                reason = f"below_threshold ({score:.2f} < {settings.QC_MIN_SIMILARITY})"
+            elif len(scores) >= 3 and (median - score) / mad > settings.QC_OUTLIER_MAD:
+                reason = f"outlier ({score:.2f} vs median {median:.2f})"
+            else:
+                reason = ""
+            results[owner] = QCResult(asset=assets[owner], score=score, flagged=bool(reason), reason=reason)
+
+    for r in results:
+        status = f"FLAGGED: {r.reason}" if r.flagged else "ok"
+        print(f"[QC] {r.asset.page_id} ({r.asset.role}): {r.score:.3f} {status}")
+    return results
@@ -1,24 +1,37 @@
 import insightface
 import numpy as np
 import cv2
-import urllib.request
 import os
 from insightface.app import FaceAnalysis
-
-# Global app cache
-_app = None
-
-def get_app():
-    global _app
-    if _app is not None:
-        return _app
+from app.services.ai import onnx_runtime
+from app.utils import http_client
+
+# Task-specific analyzers. Each process only loads what it calls:
+# the validation worker only detects, the order worker does identity + QC (recognition).
+ANALYZER_MODULES = {
+    "detection": ["detection"],
+    "recognition": ["detection", "recognition", "genderage"],
+}
+
+# Global analyzer cache: kind -> FaceAnalysis
+_analyzers = {}
+
+def get_analyzer(kind: str = "recognition"):
+    if kind in _analyzers:
+        return _analyzers[kind]
         
     try:
-        print("Initializing InsightFace (Lazy Load)...")
-        _app = FaceAnalysis(name='buffalo_s', providers=['CPUExecutionProvider'])
-        _app.prepare(ctx_id=0, det_size=(640, 640))
-        print("InsightFace Initialized Successfully.")
-        return _app
+        print(f"Initializing InsightFace [{kind}] (Lazy Load)...")
+        analyzer = FaceAnalysis(
+            name='buffalo_s',
+            allowed_modules=ANALYZER_MODULES[kind],
+            providers=onnx_runtime.get_providers()
+        )
+        onnx_runtime.apply_to_face_analysis(analyzer)
+        analyzer.prepare(ctx_id=0, det_size=(640, 640))
+        _analyzers[kind] = analyzer
+        print(f"InsightFace [{kind}] Initialized Successfully.")
+        return analyzer
     except Exception as e:
         print(f"CRITICAL WARNING: InsightFace Failed to Initialize: {e}")
         # Auto-Heal logic...
@@ -27,6 +40,14 @@ def get_app():
              pass 
         return None
 
+def get_detector():
+    """Detection only (face count / bboxes / landmarks). Used by photo validation."""
+    return get_analyzer("detection")
+
+def get_app():
+    """Detection + recognition embeddings + gender/age. Used by identity extraction and QC."""
+    return get_analyzer("recognition")
+
 # Accessor for legacy code (will be None initially, must use get_app() or update consumers)
 app = None
 
@@ -57,9 +78,9 @@ def _url_to_image(url: str):
         
     # Remote URL
     try:
-        with urllib.request.urlopen(url) as resp:
-            image_array = np.asarray(bytearray(resp.read()), dtype=np.uint8)
-            image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+        buf = http_client.download_buffer(url)
+        image_array = np.frombuffer(buf.getbuffer(), dtype=np.uint8)
+        image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
         return image
     except Exception as e:
         raise ValueError(f"Failed to download image from {url}: {e}")
@@ -67,47 +88,26 @@ def _url_to_image(url: str):
 def verify_identity(original_url: str, generated_url: str) -> float:
     """
     Calculates Cosine Similarity between source and generated faces.
+    The source side comes from the embedding store, so the source photo
+    is only analyzed once no matter how many pages are checked.
     Returns: Score (0.0 to 1.0)
     """
+    from app.services.ai import face_analysis, embedding_store
+
     try:
         model = get_app()
         if model is None:
             print("Warning: InsightFace app failed to load. Skipping verification.")
             return 0.0 # Fail safe
 
-        source_img = _url_to_image(original_url)
-        gen_img = _url_to_image(generated_url)
-        
-        if source_img is None or gen_img is None:
-            return 0.0
+        # Source: persistent store (analyzed once per upload/master). Generated: new image only.
+        source_faces = embedding_store.get_or_compute(original_url, kind="upload")
+        generated = face_analysis.analyze(generated_url)
 
-        # Detect faces
-        faces_source = model.get(source_img)
-        faces_gen = model.get(gen_img)
-
-        # We need exactly 1 face in each for strict comparison
-        if len(faces_source) == 0 or len(faces_gen) == 0:
-            return 0.0
-        
-        # Take the largest face (index 0 usually sorted by size in insightface?)
-        # InsightFace returns sorted by det score usually, but let's assume primary face.
-        # We can sort by area to be safe if multiple faces
-        source_face = sorted(faces_source, key=lambda x: (x.bbox[2]-x.bbox[0])*(x.bbox[3]-x.bbox[1]), reverse=True)[0]
-        gen_face = sorted(faces_gen, key=lambda x: (x.bbox[2]-x.bbox[0])*(x.bbox[3]-x.bbox[1]), reverse=True)[0]
-
-        source_embedding = source_face.embedding
-        gen_embedding = gen_face.embedding
-
-        # Compute Cosine Similarity
-        # Dot product / (Norm A * Norm B)
-        sim = np.dot(source_embedding, gen_embedding) / (
-            np.linalg.norm(source_embedding) * np.linalg.norm(gen_embedding)
-        )
-        
-        return float(sim)
+        # Take the largest face in each
+        source_face = source_faces[0] if source_faces else None
+        return embedding_store.similarity(source_face, generated.primary_face())
 
     except Exception as e:
         print(f"InsightFace error: {e}")
         return 0.0
-
-
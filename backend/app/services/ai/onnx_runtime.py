@@ -0,0 +1,123 @@
+import os
+import tempfile
+import onnxruntime as ort
+from app.core.config import settings
+
+# Single place where ONNX sessions are configured.
+# Every model the app runs (rembg u2net, InsightFace buffalo_s) must go through here,
+# otherwise each Celery process spawns a full default thread pool and the box oversubscribes.
+
+_GRAPH_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+_EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+
+# Global rembg session cache (one per model name + precision)
+_rembg_sessions = {}
+
+
+def get_session_options() -> ort.SessionOptions:
+    """Builds SessionOptions from settings. A fresh object per session (ORT does not share them safely)."""
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = settings.ONNX_INTRA_OP_THREADS
+    opts.inter_op_num_threads = settings.ONNX_INTER_OP_THREADS
+    opts.graph_optimization_level = _GRAPH_LEVELS.get(
+        settings.ONNX_GRAPH_OPTIMIZATION.lower(), ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    )
+    opts.execution_mode = _EXECUTION_MODES.get(
+        settings.ONNX_EXECUTION_MODE.lower(), ort.ExecutionMode.ORT_SEQUENTIAL
+    )
+    opts.enable_cpu_mem_arena = settings.ONNX_ENABLE_MEM_ARENA
+    return opts
+
+
+def get_providers() -> list:
+    return list(settings.ONNX_PROVIDERS)
+
+
+def create_session(model_path: str) -> ort.InferenceSession:
+    return ort.InferenceSession(model_path, sess_options=get_session_options(), providers=get_providers())
+
+
+def model_path_for(fp32_path: str, precision: str = "fp32") -> str:
+    """
+    Returns the model file to load for the requested precision.
+    int8 variants are produced once with dynamic (weight-only) quantization and stored
+    under CACHE_DIR/models. NOT next to the fp32 file: FaceAnalysis globs every *.onnx
+    in the pack dir and would pick the int8 copy up as a duplicate task.
+    Run eval_quantization.py before enabling.
+    """
+    if precision == "fp32":
+        return fp32_path
+    if precision != "int8":
+        raise ValueError(f"Unsupported model precision: {precision}")
+
+    pack = os.path.basename(os.path.dirname(fp32_path))
+    name, ext = os.path.splitext(os.path.basename(fp32_path))
+    out_dir = os.path.join(settings.CACHE_DIR, "models")
+    int8_path = os.path.join(out_dir, f"{pack}_{name}.int8{ext}")
+    if os.path.exists(int8_path):
+        return int8_path
+
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    print(f"[ONNX] Quantizing {fp32_path} -> {int8_path} (one-time)...")
+    os.makedirs(out_dir, exist_ok=True)
+    # Write to a temp name first so a concurrent process never loads a half-written model
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, suffix=ext)
+    os.close(fd)
+    try:
+        quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QUInt8)
+        os.replace(tmp_path, int8_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return int8_path
+
+
+def apply_to_face_analysis(face_app, precision: str = None) -> None:
+    """
+    FaceAnalysis only forwards `providers` to the model zoo, not SessionOptions.
+    Rebuild each sub-model's session from its model file so our options (and precision) apply.
+    Input/output names are identical, so the wrappers keep working.
+    """
+    precision = precision or settings.FACE_MODEL_PRECISION
+    for task_name, model in face_app.models.items():
+        model_file = getattr(model, "model_file", None)
+        if not model_file:
+            continue
+        model.session = create_session(model_path_for(model_file, precision))
+        print(f"[ONNX] {task_name} ({precision}): {settings.ONNX_INTRA_OP_THREADS or 'auto'} intra / "
+              f"{settings.ONNX_INTER_OP_THREADS or 'auto'} inter threads")
+
+
+def get_rembg_session(model_name: str = "u2net", precision: str = None):
+    """
+    Returns a cached rembg session built with our SessionOptions.
+    rembg's new_session() builds its own options internally, so construct the session class directly.
+    """
+    precision = precision or settings.MATTING_MODEL_PRECISION
+    cache_key = (model_name, precision)
+    if cache_key in _rembg_sessions:
+        return _rembg_sessions[cache_key]
+
+    try:
+        from rembg.sessions import sessions_class
+        session_class = next(c for c in sessions_class if c.name() == model_name)
+        session = session_class(model_name, get_session_options(), get_providers())
+        if precision != "fp32":
+            session.inner_session = create_session(model_path_for(session_class.download_models(), precision))
+    except (ImportError, StopIteration) as e:
+        # Older rembg: fall back to the library default (options and precision not applied)
+        print(f"[ONNX] Could not apply session options to rembg ({e}). Using rembg defaults.")
+        from rembg import new_session
+        session = new_session(model_name, providers=get_providers())
+
+    _rembg_sessions[cache_key] = session
+    return session
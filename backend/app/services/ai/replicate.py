@@ -1,5 +1,6 @@
 import replicate
 from app.core.config import settings
+from app.services import admission
 import time
 import os
 from typing import Union, IO
@@ -189,17 +190,16 @@ def swap_face(source_url: str, target_url: Union[str, IO]) -> str:
              source_input = opened_source_file
         elif source_url.startswith("http"):
              # FORCE DOWNLOAD to local temp to avoid Replicate URL issues
-             import requests
              import tempfile
+             from app.utils import http_client
              print(f"DEBUG: Downloading source URL to temp file: {source_url}")
              try:
-                 r = requests.get(source_url, stream=True)
-                 r.raise_for_status()
                  tf = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-                 for chunk in r.iter_content(chunk_size=8192): 
-                     tf.write(chunk)
-                 tf.close()
                  temp_source_path = tf.name
+                 try:
+                     http_client.stream_to(source_url, tf)
+                 finally:
+                     tf.close()
                  print(f"DEBUG: Source saved to {temp_source_path}")
                  opened_source_file = open(temp_source_path, "rb")
                  source_input = opened_source_file
@@ -428,16 +428,17 @@ def generate_character_variant(
         print(f"Prompt (First 200 chars): {prompt[:200]}...")
         print(f"Prompt (Last 200 chars): ...{prompt[-200:]}")
         
-        output = client.run(
-            full_model_id,
-            input={
-                "image_input": images_list, 
-                "prompt": prompt + " (Vertical Portrait Layout, 3:4 Aspect Ratio)", 
-                "safety_settings": "BLOCK_NONE",
-                "safety_filter_level": "block_none",
-                "aspect_ratio": "3:4"
-            }
-        )
+        with admission.prediction_slot():
+            output = client.run(
+                full_model_id,
+                input={
+                    "image_input": images_list, 
+                    "prompt": prompt + " (Vertical Portrait Layout, 3:4 Aspect Ratio)", 
+                    "safety_settings": "BLOCK_NONE",
+                    "safety_filter_level": "block_none",
+                    "aspect_ratio": "3:4"
+                }
+            )
         
         if isinstance(output, list) and len(output) > 0:
             return str(output[0])
@@ -1,81 +1,156 @@
+import io
 import cv2
 import numpy as np
-import urllib.request
+from PIL import Image
 import app.services.ai.insight as insight_service
+from app.services.ai import face_analysis
+from app.services.ai.face_analysis import FaceAnalysisResult
 
 # NOTE: We access insight_service.app dynamically to avoid import-time reference staleness.
 
+MIN_DIMENSION = 500
+BLUR_THRESHOLD = 100
+# Blur is measured on a grayscale copy with this long edge, so the score does not
+# depend on upload size (and a 12MP photo is not run through a full-res Laplacian).
+BLUR_PROBE_LONG_EDGE = 1024
+
 def validate_photo(photo_url: str) -> dict:
     """
     Validates a photo for clarity and single-face presence.
-    Returns: {"valid": bool, "reason": str}
+    Stages run cheapest first and exit early:
+      1. Header-only dimension probe (no decode)
+      2. Blur score on a reduced grayscale decode
+      3. Face detection (only for plausible photos)
+    Returns: {"valid": bool, "reason": str, "checks": {...}}
     """
-    # 0. Safety Check for AI Model
-    model = insight_service.get_app()
+    try:
+        data = face_analysis.read_source_bytes(photo_url)
+    except ValueError as e:
+        return {"valid": False, "reason": str(e)}
+    except Exception as e:
+        return _system_error(e)
+
+    try:
+        # 1. Resolution Check (header only)
+        width, height = probe_dimensions(data)
+    except Exception:
+        return {"valid": False, "reason": "Could not decode image."}
+
+    if min(width, height) < MIN_DIMENSION:
+        return _build_result(width, height, blur_score=None, face_count=None)
+
+    try:
+        # 2. Blur Check (reduced grayscale)
+        blur_score = blur_score_from_bytes(data, width, height)
+    except ValueError as e:
+        return {"valid": False, "reason": str(e)}
+
+    if blur_score < BLUR_THRESHOLD:
+        return _build_result(width, height, blur_score=blur_score, face_count=None)
+
+    # 3. Face Count Check (Safety Check for AI Model first)
+    model = insight_service.get_detector()
     if model is None:
         print("WARNING: FaceAnalysis app failed to load. Skipping Face/Gender checks.")
         return {
-             "valid": False, 
+             "valid": False,
              "reason": "AI System could not initialize. Check server logs.",
              "checks": {"face_detected": False}
         }
 
     try:
-        # 1. Download & Decode
-        # urllib handles 'http', 'https', and 'file://' schemes automatically.
-        with urllib.request.urlopen(photo_url) as resp:
-            image_array = np.asarray(bytearray(resp.read()), dtype=np.uint8)
-            img = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
-
-        if img is None:
-            return {"valid": False, "reason": "Could not decode image."}
-
-        height, width = img.shape[:2]
-        min_dim = min(height, width)
-        
-        # 2. Blur Check (Laplacian Variance)
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        blur_score = cv2.Laplacian(gray, cv2.CV_64F).var()
-        is_sharp = blur_score >= 100
-        
-        # 3. Face Count Check
         print(f"Detecting faces in {photo_url}...")
-        faces = model.get(img)
-        face_count = len(faces)
-        has_one_face = face_count == 1
-        
-        # 4. Resolution Check
-        is_high_res = min_dim >= 500
-        
-        # Overall Validity
-        is_valid = bool(is_sharp and has_one_face and is_high_res)
-        
-        failure_reasons = []
-        if not is_sharp: failure_reasons.append("Image is too blurry")
-        if not has_one_face: failure_reasons.append(f"Found {int(face_count)} faces (expected 1)")
-        if not is_high_res: failure_reasons.append(f"Low resolution ({int(min_dim)}px < 500px)")
-        
-        return {
-            "valid": is_valid,
-            "reason": "; ".join(failure_reasons) if failure_reasons else "All checks passed",
-            "checks": {
-                "face_detected": bool(has_one_face),
-                "is_sharp": bool(is_sharp),
-                "is_high_res": bool(is_high_res),
-                "face_count": int(face_count),
-                "blur_score": int(blur_score),
-                "resolution": f"{int(width)}x{int(height)}"
-            }
-        }
+        analysis = face_analysis.analyze_bytes(data, with_embeddings=False)
+    except ValueError as e:
+        return {"valid": False, "reason": str(e)}
+    except Exception as e:
+        return _system_error(e)
+
+    return _build_result(width, height, blur_score=blur_score, face_count=analysis.face_count)
 
+def validate_analysis(analysis: FaceAnalysisResult) -> dict:
+    """
+    Runs the checks on an existing FaceAnalysisResult (no extra detector pass).
+    Returns: {"valid": bool, "reason": str, "checks": {...}}
+    """
+    try:
+        gray = cv2.cvtColor(analysis.image, cv2.COLOR_BGR2GRAY)
+        blur_score = _laplacian_score(gray)
+        return _build_result(analysis.width, analysis.height, blur_score=blur_score, face_count=analysis.face_count)
     except Exception as e:
-        print(f"Validation Critical Error: {e}")
-        return {
-            "valid": False, 
-            "reason": f"System Error processing photo: {str(e)}",
-            "checks": {
-                "face_detected": False,
-                "is_sharp": False,
-                "is_high_res": False
-            }
+        return _system_error(e)
+
+def is_definitive(result: dict) -> bool:
+    """True if the result reflects the image itself (not a load/system error), i.e. safe to cache."""
+    return "resolution" in result.get("checks", {})
+
+def probe_dimensions(data: bytes) -> tuple:
+    """(width, height) from the image header. PIL does not decode pixels until asked."""
+    with Image.open(io.BytesIO(data)) as img:
+        return img.size
+
+def blur_score_from_bytes(data: bytes, width: int, height: int) -> float:
+    """Laplacian variance on a reduced grayscale decode (JPEG decodes at 1/2, 1/4, 1/8 natively)."""
+    long_edge = max(width, height)
+    flag = cv2.IMREAD_GRAYSCALE
+    for factor, reduced_flag in ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+                                 (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                                 (2, cv2.IMREAD_REDUCED_GRAYSCALE_2)):
+        if long_edge / factor >= BLUR_PROBE_LONG_EDGE:
+            flag = reduced_flag
+            break
+
+    gray = cv2.imdecode(np.frombuffer(data, np.uint8), flag)
+    if gray is None:
+        raise ValueError("Could not decode image.")
+    return _laplacian_score(gray)
+
+def _laplacian_score(gray: np.ndarray) -> float:
+    long_edge = max(gray.shape[:2])
+    if long_edge > BLUR_PROBE_LONG_EDGE:
+        scale = BLUR_PROBE_LONG_EDGE / long_edge
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+def _build_result(width: int, height: int, blur_score, face_count) -> dict:
+    """
+    Same `checks` shape for every stage. Checks that were skipped because an earlier,
+    cheaper stage already failed report as not passed.
+    """
+    min_dim = min(height, width)
+    is_high_res = min_dim >= MIN_DIMENSION
+    is_sharp = blur_score is not None and blur_score >= BLUR_THRESHOLD
+    has_one_face = face_count == 1
+
+    # Overall Validity
+    is_valid = bool(is_sharp and has_one_face and is_high_res)
+
+    failure_reasons = []
+    if not is_high_res: failure_reasons.append(f"Low resolution ({int(min_dim)}px < {MIN_DIMENSION}px)")
+    if blur_score is not None and not is_sharp: failure_reasons.append("Image is too blurry")
+    if face_count is not None and not has_one_face: failure_reasons.append(f"Found {int(face_count)} faces (expected 1)")
+
+    return {
+        "valid": is_valid,
+        "reason": "; ".join(failure_reasons) if failure_reasons else "All checks passed",
+        "checks": {
+            "face_detected": bool(has_one_face),
+            "is_sharp": bool(is_sharp),
+            "is_high_res": bool(is_high_res),
+            "face_count": int(face_count or 0),
+            "blur_score": int(blur_score or 0),
+            "resolution": f"{int(width)}x{int(height)}"
+        }
+    }
+
+def _system_error(e: Exception) -> dict:
+    print(f"Validation Critical Error: {e}")
+    return {
+        "valid": False,
+        "reason": f"System Error processing photo: {str(e)}",
+        "checks": {
+            "face_detected": False,
+            "is_sharp": False,
+            "is_high_res": False
         }
+    }
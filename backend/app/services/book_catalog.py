@@ -0,0 +1,169 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from typing import List, Optional
+from PIL import Image
+from app.core.config import settings
+
+# In-memory book catalog for GET /books.
+# Built once at startup from assets/templates and rebuilt when the tree changes
+# (a background thread compares a stat-only fingerprint), so serving the list
+# costs no disk I/O. Cover thumbnails are generated at index time.
+
+ASSETS_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "assets")
+TEMPLATES_DIR = os.path.join(ASSETS_ROOT, "templates")
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static")
+THUMBNAIL_DIR = os.path.join(STATIC_DIR, "thumbnails")
+
+_VERSION_RE = re.compile(r"^v(\d+)$")
+_ROLE_RE = re.compile(r"^(?:ref_master_|master_ref_|ref_)([a-z]+)\.png$")
+
+
+def _latest_version(book_dir: str) -> Optional[str]:
+    versions = [d for d in os.listdir(book_dir) if _VERSION_RE.match(d) and os.path.isdir(os.path.join(book_dir, d))]
+    return max(versions, key=lambda v: int(v[1:])) if versions else None
+
+
+def _book_hash(book_dir: str) -> str:
+    """Content fingerprint from (path, size, mtime) of every file; no file is read."""
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(book_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            digest.update(f"{os.path.relpath(path, book_dir)}:{stat.st_size}:{int(stat.st_mtime)}".encode())
+    return digest.hexdigest()
+
+
+def _find_cover(book_id: str, version: Optional[str]) -> Optional[str]:
+    candidates = [os.path.join(TEMPLATES_DIR, book_id, "cover.png")]
+    if version:
+        candidates.append(os.path.join(TEMPLATES_DIR, book_id, version, "cover.png"))
+    candidates.append(os.path.join(STATIC_DIR, "templates", book_id, "cover.png"))
+    return next((c for c in candidates if os.path.exists(c)), None)
+
+
+def _make_thumbnail(cover_path: str, book_id: str, book_hash: str) -> Optional[str]:
+    """Writes static/thumbnails/{book_id}.{hash}.jpg once per cover version (immutable name). Returns its URL path."""
+    filename = f"{book_id}.{book_hash[:16]}.jpg"
+    thumb_path = os.path.join(THUMBNAIL_DIR, filename)
+    if not os.path.exists(thumb_path):
+        try:
+            os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+            with Image.open(cover_path) as img:
+                img.thumbnail((settings.BOOK_THUMBNAIL_SIZE, settings.BOOK_THUMBNAIL_SIZE), Image.LANCZOS)
+                img.convert("RGB").save(thumb_path, format="JPEG", quality=85, optimize=True)
+        except Exception as e:
+            print(f"[BookCatalog] Thumbnail failed for {book_id}: {e}")
+            return None
+    return f"/static/thumbnails/{filename}"
+
+
+def index_book(book_id: str) -> dict:
+    book_dir = os.path.join(TEMPLATES_DIR, book_id)
+    version = _latest_version(book_dir)
+    version_dir = os.path.join(book_dir, version) if version else book_dir
+
+    # Optional per-book metadata (book.json in the book or version dir)
+    meta = {}
+    for meta_path in (os.path.join(version_dir, "book.json"), os.path.join(book_dir, "book.json")):
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            break
+
+    pages_dir = os.path.join(version_dir, "pages")
+    pages = sorted(p for p in os.listdir(pages_dir) if p.startswith("p")) if os.path.isdir(pages_dir) else []
+
+    # Roles: any ref_{role}.png / ref_master_{role}.png in the version or page dirs
+    roles = set()
+    for folder in [version_dir] + [os.path.join(pages_dir, p) for p in pages]:
+        if os.path.isdir(folder):
+            for name in os.listdir(folder):
+                match = _ROLE_RE.match(name)
+                if match:
+                    roles.add(match.group(1))
+
+    book_hash = _book_hash(book_dir)
+    cover_path = _find_cover(book_id, version)
+    thumbnail_url = _make_thumbnail(cover_path, book_id, book_hash) if cover_path else None
+    cover_full_url = f"/static/templates/{book_id}/cover.png" # Placeholder (existing static convention)
+
+    return {
+        "id": book_id,
+        "title": meta.get("title") or book_id.replace("_", " ").title(),
+        "description": meta.get("description"),
+        "price": meta.get("price"),
+        "version": version,
+        "page_count": len(pages),
+        "roles": sorted(roles or meta.get("roles", [])),
+        "hash": book_hash,
+        "cover_url": thumbnail_url or cover_full_url,
+        "cover_full_url": cover_full_url,
+    }
+
+
+class BookCatalog:
+    def __init__(self, templates_dir: str = TEMPLATES_DIR):
+        self.templates_dir = templates_dir
+        self.books: List[dict] = []
+        self.etag: Optional[str] = None
+        self._fingerprint = None
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    def _tree_fingerprint(self) -> tuple:
+        """Directory mtimes change whenever entries are added/removed/renamed below them."""
+        if not os.path.isdir(self.templates_dir):
+            return ()
+        stamps = []
+        for root, dirs, files in os.walk(self.templates_dir):
+            stamps.append((root, os.stat(root).st_mtime_ns))
+            for name in files:
+                stamps.append((name, os.stat(os.path.join(root, name)).st_mtime_ns))
+        return tuple(sorted(stamps))
+
+    def rebuild(self) -> None:
+        fingerprint = self._tree_fingerprint()
+        books = []
+        if os.path.isdir(self.templates_dir):
+            for book_id in sorted(os.listdir(self.templates_dir)):
+                if os.path.isdir(os.path.join(self.templates_dir, book_id)):
+                    try:
+                        books.append(index_book(book_id))
+                    except Exception as e:
+                        print(f"[BookCatalog] Skipping {book_id}: {e}")
+
+        etag = hashlib.sha256("".join(b["hash"] for b in books).encode()).hexdigest()[:16]
+        with self._lock:
+            self.books = books
+            self.etag = f'"{etag}"'
+            self._fingerprint = fingerprint
+        print(f"[BookCatalog] Indexed {len(books)} books.")
+
+    def refresh_if_changed(self) -> bool:
+        if self._tree_fingerprint() == self._fingerprint:
+            return False
+        self.rebuild()
+        return True
+
+    def start(self) -> None:
+        """Initial build + background watcher (daemon thread)."""
+        self.rebuild()
+        if self._watcher is None and settings.BOOK_CATALOG_REFRESH_SECONDS > 0:
+            self._watcher = threading.Thread(target=self._watch, name="book-catalog-watcher", daemon=True)
+            self._watcher.start()
+
+    def _watch(self) -> None:
+        stop = threading.Event()
+        while not stop.wait(settings.BOOK_CATALOG_REFRESH_SECONDS):
+            try:
+                self.refresh_if_changed()
+            except Exception as e:
+                print(f"[BookCatalog] Refresh failed: {e}")
+
+
+catalog = BookCatalog()
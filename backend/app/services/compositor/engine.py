@@ -1,10 +1,9 @@
 import os
-import io
 import json
 from typing import Dict, Any, Optional
 from PIL import Image, ImageFilter, ImageDraw
-import requests
 import traceback
+from app.utils import http_client
 
 class CompositorEngine:
     def __init__(self, assets_root: str):
@@ -49,9 +48,7 @@ class CompositorEngine:
 
     def _load_image(self, path: str) -> Image.Image:
         if path.startswith("http"):
-            resp = requests.get(path)
-            resp.raise_for_status()
-            img = Image.open(io.BytesIO(resp.content)).convert("RGBA")
+            img = Image.open(http_client.download_buffer(path)).convert("RGBA")
         else:
             if not os.path.exists(path):
                 # Fallback for testing if file missing
@@ -5,7 +5,15 @@ from app.services.ai import replicate as replicate_service
 from app.core.config import settings
 from app.utils.image_processing import process_character_output
 from app.services.storage.supabase_service import SupabaseService
+from app.utils import http_client
+from app.services.ai import embedding_store
+from app.services import upload_store
 import json
+import hashlib
+
+# Bump when master generation changes in code (model, style_strength, post-processing)
+# so masters cached in the upload store are regenerated.
+MASTER_GENERATOR_VERSION = "1"
 
 class GeneratorService:
 
@@ -27,6 +35,15 @@ class GeneratorService:
         return {}
 
 
+    @staticmethod
+    def _master_artifact_key(book_id: str, role: str, ref_path: str, prompt: str) -> str:
+        """master:{book}:{role}:{fingerprint of master ref content + prompt + generator version}"""
+        fingerprint = hashlib.sha256()
+        fingerprint.update(MASTER_GENERATOR_VERSION.encode())
+        fingerprint.update(upload_store.content_hash_for(ref_path).encode())
+        fingerprint.update(prompt.encode())
+        return f"master:{book_id}:{role}:{fingerprint.hexdigest()[:16]}"
+
     def generate_master_character(self, 
                                order_id: str, 
                                user_photo_path: str,
@@ -46,7 +63,6 @@ class GeneratorService:
         filename = f"master_{role}.png"
         output_path = os.path.join(output_dir, filename)
         
-        # Check cache
         # Force Overwrite: Delete existing file to ensure new prompt is used
         if os.path.exists(output_path):
              os.remove(output_path)
@@ -72,6 +88,22 @@ class GeneratorService:
         # If master_ref_path is None, we might fail or need a fallback.
         
         ref_path_to_use = master_ref_path if master_ref_path else user_photo_path
+
+        # Check cache: a master generated earlier from the same photo (upload store).
+        # Keyed by book, role, master ref content and prompt, so a different book,
+        # an updated template or an edited prompt never reuses a stale master.
+        source_hash = None
+        artifact_key = None
+        try:
+            source_hash = upload_store.content_hash_for(user_photo_path)
+            artifact_key = self._master_artifact_key(book_id, role, ref_path_to_use, prompt)
+            cached_master = upload_store.get_artifact(source_hash, artifact_key)
+            if cached_master:
+                shutil.copy2(cached_master, output_path)
+                print(f"Reusing Master Character from upload store: {cached_master}")
+                return output_path
+        except Exception as e:
+            print(f"Master cache lookup skipped: {e}")
         
         try:
             generated_url = replicate_service.generate_character_variant(
@@ -84,18 +116,30 @@ class GeneratorService:
             if not generated_url:
                 raise Exception("Master generation returned None")
                 
-            # Download
-            import requests
-            resp = requests.get(generated_url)
-            resp.raise_for_status()
+            # Download (pooled, streamed, size-capped)
+            generated_bytes = http_client.download_bytes(generated_url)
             
             # Post-Process: Rembg + Auto-Crop (Fixes Side-by-Side hallucinations)
-            processed_data = process_character_output(resp.content)
+            processed_data = process_character_output(generated_bytes)
             
             with open(output_path, "wb") as f:
                 f.write(processed_data)
             
             print(f"Master Character Saved: {output_path}")
+
+            # Store master embeddings for page QC (best effort)
+            if settings.QC_ENABLED:
+                try:
+                    embedding_store.get_or_compute(output_path, kind="master")
+                except Exception as e:
+                    print(f"Master embedding skipped: {e}")
+
+            # Keep for re-uploads of the same photo (best effort)
+            if source_hash and artifact_key:
+                try:
+                    upload_store.save_artifact(source_hash, artifact_key, output_path)
+                except Exception as e:
+                    print(f"Master artifact not stored: {e}")
             
             # Supabase Upload
             if self.supabase:
@@ -157,12 +201,10 @@ class GeneratorService:
             if not generated_url:
                  raise Exception("Page generation returned None")
 
-            import requests
-            resp = requests.get(generated_url)
-            resp.raise_for_status()
+            generated_bytes = http_client.download_bytes(generated_url)
             
             # Post-Process: Rembg + Auto-Crop
-            processed_data = process_character_output(resp.content)
+            processed_data = process_character_output(generated_bytes)
             
             with open(output_path, "wb") as f:
                 f.write(processed_data)
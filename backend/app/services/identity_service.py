@@ -2,11 +2,32 @@ import os
 import json
 import uuid
 import shutil
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Callable, List, Optional, Union
 import cv2
 import numpy as np
 from app.services.ai import validator
-from app.services.ai import insight as insight_service
+from app.services.ai import face_analysis
+from app.services.ai.face_analysis import DetectedFace
+
+# Role assignment heuristics for multi-identity photos.
+# Each ranks the detected faces; roles are handed out in that order
+# (e.g. roles=["mom", "child"] with "size" -> largest face is mom).
+def _rank_by_size(faces: List[DetectedFace]) -> List[DetectedFace]:
+    return sorted(faces, key=lambda f: f.area, reverse=True)
+
+def _rank_by_age(faces: List[DetectedFace]) -> List[DetectedFace]:
+    # Oldest first. Faces without an age estimate fall back to size order.
+    return sorted(faces, key=lambda f: (f.age if f.age is not None else -1, f.area), reverse=True)
+
+def _rank_by_position(faces: List[DetectedFace]) -> List[DetectedFace]:
+    # Left to right
+    return sorted(faces, key=lambda f: float(f.bbox[0] + f.bbox[2]) / 2)
+
+ROLE_ASSIGNERS: Dict[str, Callable[[List[DetectedFace]], List[DetectedFace]]] = {
+    "size": _rank_by_size,
+    "age": _rank_by_age,
+    "position": _rank_by_position,
+}
 
 class IdentityService:
     def __init__(self, assets_root: str):
@@ -20,6 +41,42 @@ class IdentityService:
         role: 'child' or 'mom'
         face_index: 0 for largest face, 1 for second largest, etc.
         """
+        analysis, filename = self._prepare_source(order_id, photo_path)
+
+        # Sort by size to pick the primary subject
+        sorted_faces = analysis.sorted_faces()
+        
+        if face_index >= len(sorted_faces):
+             raise ValueError(f"Requested face_index {face_index} but only found {len(sorted_faces)} faces.")
+             
+        face = sorted_faces[face_index]
+        print(f"Selected face index {face_index}: {int(face.bbox[2]-face.bbox[0])}x{int(face.bbox[3]-face.bbox[1])} px")
+        return self._write_identity(order_id, analysis.image, face, role, filename)
+
+    def create_identities(self, order_id: str, photo_path: str, roles: List[str],
+                          assigner: Union[str, Callable[[List[DetectedFace]], List[DetectedFace]]] = "size") -> Dict[str, Dict[str, Any]]:
+        """
+        Extracts several identities from one photo in a single pass
+        (one validation, one input copy, one decode + detection).
+        roles: in assignment order, e.g. ["mom", "child"]
+        assigner: key of ROLE_ASSIGNERS ('size', 'age', 'position') or a callable ranking the faces.
+        Returns: {role: identity_data}
+        """
+        rank = ROLE_ASSIGNERS[assigner] if isinstance(assigner, str) else assigner
+        analysis, filename = self._prepare_source(order_id, photo_path)
+
+        ranked = rank(list(analysis.faces))
+        if len(ranked) < len(roles):
+             raise ValueError(f"Requested {len(roles)} identities but only found {len(ranked)} faces.")
+
+        identities = {}
+        for role, face in zip(roles, ranked):
+            print(f"Assigned {role}: {int(face.bbox[2]-face.bbox[0])}x{int(face.bbox[3]-face.bbox[1])} px (age {face.age})")
+            identities[role] = self._write_identity(order_id, analysis.image, face, role, filename)
+        return identities
+
+    def _prepare_source(self, order_id: str, photo_path: str):
+        """Validates the photo and copies it to the order's input dir. Returns (analysis, filename)."""
         # 1. Validation
         print(f"Validating photo: {photo_path}")
         
@@ -27,50 +84,35 @@ class IdentityService:
         import pathlib
         photo_url = pathlib.Path(os.path.abspath(photo_path)).as_uri()
         
-        validation_result = validator.validate_photo(photo_url)
+        # One detector pass, shared by validation and extraction (cached per image content)
+        analysis = face_analysis.analyze(photo_url)
+        validation_result = validator.validate_analysis(analysis)
         if not validation_result["valid"]:
              print(f"WARNING: Validation failed ({validation_result['reason']}). Proceeding with best effort...")
 
+        if not analysis.faces:
+             raise ValueError("No faces detected during extraction")
+
         # 2. Setup Order Directory
-        order_dir = os.path.join(self.orders_dir, order_id)
-        # Use sub-folder per role to avoid overwriting if both come from same input but separate calls
-        identity_dir = os.path.join(order_dir, "identity", role) 
-        input_dir = os.path.join(order_dir, "input")
-        os.makedirs(identity_dir, exist_ok=True)
+        input_dir = os.path.join(self.orders_dir, order_id, "input")
         os.makedirs(input_dir, exist_ok=True)
 
         # Copy source image to input dir
         filename = os.path.basename(photo_path)
         dest_path = os.path.join(input_dir, filename)
-        if hasattr(os, "symlink"):
-             # For dev speed, maybe symlink? No, copy is safer for "upload" simulation
-             try:
-                shutil.copy2(photo_path, dest_path)
-             except shutil.SameFileError:
-                pass
-        else:
-             try:
-                shutil.copy2(photo_path, dest_path)
-             except shutil.SameFileError:
-                pass
+        try:
+            shutil.copy2(photo_path, dest_path)
+        except shutil.SameFileError:
+            pass
+        return analysis, filename
+
+    def _write_identity(self, order_id: str, img: np.ndarray, face: DetectedFace, role: str, filename: str) -> Dict[str, Any]:
+        """Writes the face crop + identity.json for one role."""
+        # Use sub-folder per role to avoid overwriting when several roles come from the same input
+        identity_dir = os.path.join(self.orders_dir, order_id, "identity", role)
+        os.makedirs(identity_dir, exist_ok=True)
 
         # 3. Attribute Extraction (Heuristic for now)
-        # Load image again for processing (validator decoded it but didn't return it)
-        img = insight_service._url_to_image(photo_url)
-        faces = insight_service.app.get(img)
-        
-        if not faces:
-             raise ValueError("No faces detected during extraction")
-        
-        # Sort by size to pick the primary subject
-        sorted_faces = sorted(faces, key=lambda x: (x.bbox[2]-x.bbox[0])*(x.bbox[3]-x.bbox[1]), reverse=True)
-        
-        if face_index >= len(sorted_faces):
-             raise ValueError(f"Requested face_index {face_index} but only found {len(sorted_faces)} faces.")
-             
-        face = sorted_faces[face_index]
-        print(f"Selected face index {face_index}: {int(face.bbox[2]-face.bbox[0])}x{int(face.bbox[3]-face.bbox[1])} px")
-        
         # Simple Skin Tone Estimator
         # Get center of face (nose area)
         bbox = face.bbox.astype(int)
@@ -89,7 +131,7 @@ class IdentityService:
         attributes = {
              "skin_tone_hex": skin_tone_hex,
              "age_group": role, # Use role as proxy? Or infer from face age (face.age)
-             "gender_detected": int(face.gender) if hasattr(face, 'gender') else None
+             "gender_detected": face.gender
         }
 
         # 4. Save Face Crop (Identity Ref)
@@ -0,0 +1,158 @@
+import json
+from typing import Optional
+from sqlalchemy import event, select
+from app.core.config import settings
+from app.core.redis_client import get_redis, get_async_redis
+from app.db.models import Order, OrderPage
+from app.db.crud import TOUCHED_ORDERS_KEY, PAGE_URLS_KEY
+
+# Redis write-through cache of order status + page URLs (hash per order).
+# The worker is the only writer of progress: every commit that touched an order is
+# written through here, and GET /orders/{id} reads Redis first (Postgres on a miss).
+# Values are JSON-encoded per field. Writes never move an entry to an older version.
+
+_KEY_PREFIX = "order:"
+_PENDING_KEY = "order_cache_pending" # Snapshots built before commit, written after it
+
+# HSET only if the cached version is missing or not newer than ours
+_WRITE_IF_NEWER = """
+local current = redis.call('HGET', KEYS[1], 'version')
+if current and tonumber(current) > tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+for i = 3, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+def _key(order_id) -> str:
+    return f"{_KEY_PREFIX}{order_id}"
+
+
+def to_fields(order: Order, page_urls: Optional[dict] = None) -> dict:
+    """
+    Snapshot of an order in OrderResponse shape, plus progress.
+    Pages come from `page_urls` ({page_number: image_url}) or the loaded generated_pages.
+    """
+    if page_urls is None:
+        page_urls = {p.page_number: p.image_url for p in order.generated_pages}
+    pages = [{"page_number": number, "image_url": page_urls[number]} for number in sorted(page_urls)]
+    return {
+        "id": str(order.id),
+        "status": order.status.value,
+        "created_at": order.created_at.isoformat(),
+        "story_id": order.story_id,
+        "child_name": order.child_name,
+        "photo_url": order.photo_url,
+        "mom_name": order.mom_name,
+        "mom_photo_url": order.mom_photo_url,
+        "character_asset_url": order.character_asset_url,
+        "pdf_url": order.pdf_url,
+        "failure_reason": order.failure_reason,
+        "version": order.version or 0,
+        "completed_pages": len(pages),
+        "generated_pages": pages,
+    }
+
+
+def _script_args(fields: dict) -> list:
+    args = [fields["version"], settings.ORDER_CACHE_TTL_SECONDS]
+    for name, value in fields.items():
+        args.extend([name, json.dumps(value)])
+    return args
+
+
+def _decode(raw: dict) -> Optional[dict]:
+    if not raw:
+        return None
+    return {
+        (k.decode() if isinstance(k, bytes) else k): json.loads(v)
+        for k, v in raw.items()
+    }
+
+
+def write(fields: dict) -> None:
+    try:
+        get_redis().eval(_WRITE_IF_NEWER, 1, _key(fields["id"]), *_script_args(fields))
+    except Exception as e:
+        print(f"[OrderCache] Write skipped: {e}")
+
+
+async def write_async(fields: dict) -> None:
+    try:
+        await get_async_redis().eval(_WRITE_IF_NEWER, 1, _key(fields["id"]), *_script_args(fields))
+    except Exception as e:
+        print(f"[OrderCache] Write skipped: {e}")
+
+
+async def read_async(order_id) -> Optional[dict]:
+    try:
+        return _decode(await get_async_redis().hgetall(_key(order_id)))
+    except Exception as e:
+        print(f"[OrderCache] Read skipped: {e}")
+        return None
+
+
+def enable_write_through(session_factory) -> None:
+    """
+    Writes every order touched by a committed transaction of `session_factory`
+    through to Redis (used by the Celery worker, the only progress writer).
+    Fields are built from the committing session itself: its Order objects, and
+    page URLs tracked in session.info (read once per order and session, then
+    kept current from flushed OrderPages and crud upserts). No extra connection.
+    """
+    @event.listens_for(session_factory, "after_flush")
+    def _collect(session, flush_context):
+        touched = session.info.setdefault(TOUCHED_ORDERS_KEY, set())
+        tracked = session.info.setdefault(PAGE_URLS_KEY, {})
+        for obj in list(session.new) + list(session.dirty):
+            if isinstance(obj, Order):
+                touched.add(obj.id)
+            elif isinstance(obj, OrderPage):
+                touched.add(obj.order_id)
+                if obj.order_id in tracked:
+                    tracked[obj.order_id][obj.page_number] = obj.image_url
+        for obj in session.deleted:
+            if isinstance(obj, OrderPage) and obj.order_id in tracked:
+                tracked[obj.order_id].pop(obj.page_number, None)
+
+    @event.listens_for(session_factory, "before_commit")
+    def _snapshot(session):
+        # Commit flushes after this hook; flush now so every change is collected
+        session.flush()
+        touched = session.info.pop(TOUCHED_ORDERS_KEY, None)
+        if not touched:
+            return
+        tracked = session.info.setdefault(PAGE_URLS_KEY, {})
+        snapshots = []
+        try:
+            for order_id in touched:
+                order = session.get(Order, order_id) # Identity map first
+                if order is None:
+                    continue
+                if order_id not in tracked:
+                    rows = session.execute(
+                        select(OrderPage.page_number, OrderPage.image_url).filter(OrderPage.order_id == order_id)
+                    ).all()
+                    tracked[order_id] = {row.page_number: row.image_url for row in rows}
+                snapshots.append(to_fields(order, tracked[order_id]))
+        except Exception as e:
+            print(f"[OrderCache] Write-through skipped: {e}")
+            return
+        session.info[_PENDING_KEY] = snapshots
+
+    @event.listens_for(session_factory, "after_commit")
+    def _write(session):
+        for fields in session.info.pop(_PENDING_KEY, None) or ():
+            write(fields)
+
+    @event.listens_for(session_factory, "after_rollback")
+    def _discard(session):
+        session.info.pop(TOUCHED_ORDERS_KEY, None)
+        session.info.pop(_PENDING_KEY, None)
+        # Tracked URLs may include rolled-back writes: re-read on next use
+        session.info.pop(PAGE_URLS_KEY, None)
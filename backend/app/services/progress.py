@@ -0,0 +1,104 @@
+import json
+import time
+import asyncio
+from typing import Dict, Set
+from app.core.redis_client import get_redis, get_async_redis
+
+# Order progress events over Redis pub/sub.
+# The worker publishes stage events (publish). Each web process holds ONE pattern
+# subscription and fans messages out to the in-process queues of connected SSE
+# clients (ProgressBroker), so N watchers cost one Redis connection, not N.
+
+CHANNEL_PREFIX = "order_events:"
+
+EVENT_STARTED = "started"
+EVENT_MASTER_READY = "master_ready"
+EVENT_PAGE_GENERATED = "page_generated"
+EVENT_PAGE_COMPOSITED = "page_composited"
+EVENT_COMPLETED = "completed"
+EVENT_FAILED = "failed"
+
+TERMINAL_EVENTS = {EVENT_COMPLETED, EVENT_FAILED}
+
+
+def publish(order_id: str, event: str, **data) -> None:
+    """Worker side. Best effort: progress events must never fail an order."""
+    payload = {"order_id": str(order_id), "event": event, "ts": time.time(), **data}
+    try:
+        get_redis().publish(f"{CHANNEL_PREFIX}{order_id}", json.dumps(payload))
+    except Exception as e:
+        print(f"[Progress] Publish skipped ({event}): {e}")
+
+
+class ProgressBroker:
+    """Web side: one Redis subscription per process, fanned out to per-client queues."""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._listener = None
+        self._ready = asyncio.Event() # Set while the pattern subscription is active
+
+    def subscribe(self, order_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(str(order_id), set()).add(queue)
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+        return queue
+
+    async def wait_ready(self, timeout: float = 2.0) -> bool:
+        """True once the Redis subscription is live (events published from now on are delivered)."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def unsubscribe(self, order_id: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(str(order_id))
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[str(order_id)]
+
+    async def _listen(self):
+        while self._subscribers:
+            pubsub = get_async_redis().pubsub()
+            try:
+                await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                async for message in pubsub.listen():
+                    if message.get("type") == "psubscribe":
+                        self._ready.set()
+                    if message.get("type") != "pmessage":
+                        continue
+                    self._dispatch(message["data"])
+                    if not self._subscribers:
+                        break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Progress] Subscription lost: {e}. Reconnecting...")
+                await asyncio.sleep(1)
+            finally:
+                self._ready.clear()
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    def _dispatch(self, raw) -> None:
+        try:
+            event = json.loads(raw)
+        except (TypeError, ValueError):
+            return
+        for queue in list(self._subscribers.get(event.get("order_id"), ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow client: drop the oldest event rather than block the fan-out
+                queue.get_nowait()
+                queue.put_nowait(event)
+
+
+broker = ProgressBroker()
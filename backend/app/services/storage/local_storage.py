@@ -0,0 +1,92 @@
+import os
+import gzip
+import shutil
+import hashlib
+import tempfile
+from typing import Optional
+from app.core.config import settings
+
+# Immutable, content-hashed publishing for files served from /uploads.
+# A regenerated page gets a new name (order_{id}_{page}.{hash}.png) instead of
+# overwriting the old one, so every published URL can be cached forever by the
+# browser or a CDN (see CachedStaticFiles for the headers).
+
+PUBLIC_ROOT = os.path.join(os.getcwd(), "uploads")
+HASH_LENGTH = 16
+
+# Already-compressed formats (PNG/JPEG/WebP) gain nothing from gzip/brotli
+COMPRESSIBLE_EXTENSIONS = {".json", ".svg", ".txt", ".html", ".css", ".js"}
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def _atomic_copy(src_path: str, dest_path: str) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest_path), suffix=".tmp")
+    os.close(fd)
+    try:
+        shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _write_precompressed(path: str) -> None:
+    """Writes path.gz (and path.br if brotli is installed) next to compressible files."""
+    if os.path.splitext(path)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+        return
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    try:
+        import brotli
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data))
+    except ImportError:
+        pass
+
+
+def publish_file(src_path: str, subdir: str, stem: str) -> str:
+    """
+    Copies src_path to uploads/{subdir}/{stem}.{hash}{ext} (no-op if that content
+    is already published) and returns its public URL.
+    """
+    ext = os.path.splitext(src_path)[1]
+    filename = f"{stem}.{_file_hash(src_path)}{ext}"
+    dest_dir = os.path.join(PUBLIC_ROOT, subdir)
+    dest_path = os.path.join(dest_dir, filename)
+
+    if not os.path.exists(dest_path):
+        os.makedirs(dest_dir, exist_ok=True)
+        _atomic_copy(src_path, dest_path)
+        _write_precompressed(dest_path)
+
+    return f"{settings.BASE_URL}/uploads/{subdir}/{filename}"
+
+
+def local_path_for(url: Optional[str]) -> Optional[str]:
+    """Maps a URL returned by publish_file back to its file (None for foreign URLs)."""
+    prefix = f"{settings.BASE_URL}/uploads/"
+    if not url or not url.startswith(prefix):
+        return None
+    return os.path.join(PUBLIC_ROOT, *url[len(prefix):].split("/"))
+
+
+def unpublish(url: Optional[str]) -> None:
+    """Removes a superseded artifact (and its precompressed variants). Best effort."""
+    path = local_path_for(url)
+    if not path:
+        return
+    for candidate in (path, path + ".gz", path + ".br"):
+        try:
+            os.remove(candidate)
+        except OSError:
+            pass
@@ -0,0 +1,295 @@
+import os
+import re
+import uuid
+import shutil
+import hashlib
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.db.session import SessionLocal
+from app.db.models import StoredUpload, UploadRef
+from app.utils.upload_ingest import IngestedUpload, EXTENSIONS
+from app.utils import image_processing
+
+# Content-addressed upload storage.
+# The same photo uploaded twice (second book, retried order) is stored once under its
+# SHA-256. Each upload request still gets its own upload_id (an UploadRef), and the
+# StoredUpload keeps a ref count plus the cached validation result and derived
+# artifacts (master characters), so duplicates skip all of that work.
+# Embeddings (embedding_store) are keyed by the same content hash and are reused
+# automatically. Cleaned cutouts (DiskCache) are keyed by the hash of the generated
+# image they were cut from, not of the upload.
+
+BLOB_DIR = os.path.join("uploads", "blobs")
+DERIVED_DIR = os.path.join(BLOB_DIR, "derived")
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def register(ingested: IngestedUpload) -> Tuple[str, StoredUpload]:
+    """
+    Records a reference to the ingested content (one upsert, safe when the same new
+    photo is uploaded twice at once) and creates a new upload_id for it. After the
+    commit, moves the temp file into the blob store, or drops it if the blob is
+    already there. Returns (upload_id, stored).
+    """
+    blob_path = os.path.join(BLOB_DIR, f"{ingested.sha256}{EXTENSIONS[ingested.format]}")
+
+    db = SessionLocal()
+    try:
+        stmt = pg_insert(StoredUpload).values(
+            content_hash=ingested.sha256,
+            path=blob_path,
+            format=ingested.format,
+            size=ingested.size,
+            ref_count=1,
+            artifacts={}
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[StoredUpload.content_hash],
+            set_={"ref_count": StoredUpload.ref_count + 1}
+        ).returning(StoredUpload)
+        stored = db.scalars(stmt, execution_options={"populate_existing": True}).one()
+        if stored.ref_count > 1:
+            print(f"[UploadStore] Duplicate upload {ingested.sha256[:12]} (refs: {stored.ref_count})")
+
+        upload_id = str(uuid.uuid4())
+        db.add(UploadRef(upload_id=upload_id, content_hash=ingested.sha256))
+        db.commit()
+        db.refresh(stored)
+        db.expunge(stored)
+    except BaseException:
+        os.remove(ingested.path)
+        raise
+    finally:
+        db.close()
+
+    # The row now holds our reference, so _release_refs cannot delete the blob from here on
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    if os.path.exists(stored.path):
+        os.remove(ingested.path)
+    else:
+        os.replace(ingested.path, stored.path)
+    return upload_id, stored
+
+
+def resolve(upload_id: str) -> Optional[StoredUpload]:
+    db = SessionLocal()
+    try:
+        ref = db.query(UploadRef).get(upload_id)
+        if not ref:
+            return None
+        stored = db.query(StoredUpload).get(ref.content_hash)
+        if stored:
+            db.expunge(stored)
+        return stored
+    finally:
+        db.close()
+
+
+def release(upload_id: str) -> bool:
+    """
+    Drops an upload_id. The blob and its artifacts are deleted with the last reference
+    (upload_ids and orders both hold one, see acquire_for_order).
+    """
+    db = SessionLocal()
+    try:
+        ref = db.query(UploadRef).get(upload_id)
+        if not ref:
+            return False
+        _release_refs(db, [ref])
+        return True
+    finally:
+        db.close()
+
+
+def stored_hash_for(path_or_url: str) -> Optional[str]:
+    """Content hash of a blob-store path (or file:// URL to one, or a derived copy); None otherwise."""
+    path = _local_path(path_or_url)
+    if not path:
+        return None
+    stem = os.path.splitext(os.path.basename(path))[0]
+    parent = os.path.dirname(os.path.abspath(path))
+    if _HASH_RE.match(stem) and parent == os.path.abspath(BLOB_DIR):
+        return stem
+    if _HASH_RE.match(stem[:64]) and parent == os.path.abspath(DERIVED_DIR):
+        return stem[:64]
+    return None
+
+
+def acquire_for_order(order_id, photo_urls: List[Optional[str]]) -> int:
+    """
+    Takes a reference on each stored upload an order reads (its photo URLs), so
+    releasing the upload_ids cannot delete files a queued or running order needs.
+    Released by release_order(). Returns the number of references taken.
+    """
+    db = SessionLocal()
+    try:
+        taken = 0
+        for index, url in enumerate(photo_urls):
+            content_hash = stored_hash_for(url) if url else None
+            if not content_hash:
+                continue
+            ref_id = _order_ref_id(order_id, index)
+            if db.query(UploadRef).get(ref_id):
+                continue
+            stored = db.query(StoredUpload).filter(
+                StoredUpload.content_hash == content_hash
+            ).with_for_update().first()
+            if not stored:
+                continue
+            stored.ref_count += 1
+            db.add(UploadRef(upload_id=ref_id, content_hash=content_hash))
+            taken += 1
+        db.commit()
+        return taken
+    finally:
+        db.close()
+
+
+def release_order(order_id) -> None:
+    """Drops the references taken by acquire_for_order (order finished or failed)."""
+    db = SessionLocal()
+    try:
+        refs = db.query(UploadRef).filter(UploadRef.upload_id.like(f"order:{order_id}:%")).all()
+        if refs:
+            _release_refs(db, refs)
+    finally:
+        db.close()
+
+
+def _order_ref_id(order_id, index: int) -> str:
+    return f"order:{order_id}:{index}"
+
+
+def _local_path(path_or_url: str) -> Optional[str]:
+    if path_or_url.startswith("file://"):
+        return url2pathname(urlparse(path_or_url).path)
+    if "://" in path_or_url:
+        return None
+    return path_or_url
+
+
+def _release_refs(db, refs: List[UploadRef]) -> None:
+    """Deletes refs, decrements their StoredUploads and removes content nobody references. Commits."""
+    files = []
+    for ref in refs:
+        stored = db.query(StoredUpload).filter(
+            StoredUpload.content_hash == ref.content_hash
+        ).with_for_update().first()
+        db.delete(ref)
+        if stored:
+            stored.ref_count = max(0, stored.ref_count - 1)
+            if stored.ref_count == 0:
+                files.extend([stored.path] + list((stored.artifacts or {}).values()))
+                db.delete(stored)
+        db.flush() # Next ref of the same content sees the new count
+
+    # Delete while the row locks are still held: a concurrent register() of the
+    # same content waits on them and places its blob only after this commit
+    for path in files:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    db.commit()
+
+
+def content_hash_for(path: str) -> str:
+    """
+    Content hash of the original upload behind a local photo. Free for blob-store
+    paths and their derived copies (e.g. the normalized photo), hashed otherwise.
+    """
+    stored_hash = stored_hash_for(path)
+    if stored_hash:
+        return stored_hash
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_validation(content_hash: str) -> Optional[dict]:
+    db = SessionLocal()
+    try:
+        stored = db.query(StoredUpload).get(content_hash)
+        return stored.validation if stored else None
+    finally:
+        db.close()
+
+
+def save_validation(content_hash: str, result: dict) -> None:
+    db = SessionLocal()
+    try:
+        stored = db.query(StoredUpload).get(content_hash)
+        if stored:
+            stored.validation = result
+            db.commit()
+    finally:
+        db.close()
+
+
+def get_artifact(content_hash: str, key: str) -> Optional[str]:
+    """Path of a derived artifact, or None if missing (or deleted from disk)."""
+    db = SessionLocal()
+    try:
+        stored = db.query(StoredUpload).get(content_hash)
+        path = (stored.artifacts or {}).get(key) if stored else None
+        return path if path and os.path.exists(path) else None
+    finally:
+        db.close()
+
+
+def normalized_path(stored: StoredUpload) -> str:
+    """
+    Working copy of an upload (EXIF-rotated, long edge capped, metadata stripped),
+    created once per content. Every downstream stage reads this instead of the original.
+    """
+    existing = get_artifact(stored.content_hash, "normalized")
+    if existing:
+        return existing
+
+    os.makedirs(DERIVED_DIR, exist_ok=True)
+    dest = os.path.join(DERIVED_DIR, f"{stored.content_hash}_normalized.jpg")
+    dest = image_processing.normalize_photo(stored.path, dest)
+    _record_artifact(stored.content_hash, "normalized", dest)
+    return dest
+
+
+def save_artifact(content_hash: str, key: str, source_path: str) -> Optional[str]:
+    """Copies an artifact into the blob store and records it. No-op for unknown content."""
+    db = SessionLocal()
+    try:
+        stored = db.query(StoredUpload).filter(
+            StoredUpload.content_hash == content_hash
+        ).with_for_update().first()
+        if not stored:
+            return None
+
+        os.makedirs(DERIVED_DIR, exist_ok=True)
+        safe_key = re.sub(r"[^A-Za-z0-9_.-]", "_", key)
+        dest = os.path.join(DERIVED_DIR, f"{content_hash}_{safe_key}{os.path.splitext(source_path)[1]}")
+        shutil.copy2(source_path, dest)
+
+        # Reassign so SQLAlchemy sees the JSON change
+        stored.artifacts = {**(stored.artifacts or {}), key: dest}
+        db.commit()
+        return dest
+    finally:
+        db.close()
+
+
+def _record_artifact(content_hash: str, key: str, path: str) -> None:
+    """Records an artifact that was written straight into DERIVED_DIR."""
+    db = SessionLocal()
+    try:
+        stored = db.query(StoredUpload).filter(
+            StoredUpload.content_hash == content_hash
+        ).with_for_update().first()
+        if stored:
+            stored.artifacts = {**(stored.artifacts or {}), key: path}
+            db.commit()
+    finally:
+        db.close()
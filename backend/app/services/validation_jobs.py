@@ -0,0 +1,27 @@
+import json
+from typing import Optional
+from app.core.redis_client import get_redis
+
+# Upload validation job status, shared by the web process (poll endpoint)
+# and the validation worker. Stored in Redis as JSON under upload:{upload_id}.
+
+STATUS_PENDING = "PENDING"
+STATUS_DONE = "DONE"
+STATUS_FAILED = "FAILED"
+
+_TTL_SECONDS = 24 * 3600
+
+
+def _key(upload_id: str) -> str:
+    return f"upload:{upload_id}"
+
+
+def set_status(upload_id: str, status: str, **fields) -> dict:
+    payload = {"upload_id": upload_id, "status": status, **fields}
+    get_redis().set(_key(upload_id), json.dumps(payload), ex=_TTL_SECONDS)
+    return payload
+
+
+def get_status(upload_id: str) -> Optional[dict]:
+    raw = get_redis().get(_key(upload_id))
+    return json.loads(raw) if raw else None
@@ -0,0 +1,115 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from typing import Optional
+
+
+def content_key(data: bytes, params: Optional[dict] = None) -> str:
+    """SHA-256 of the input bytes plus the (sorted) processing parameters."""
+    h = hashlib.sha256(data)
+    if params:
+        h.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+class DiskCache:
+    """
+    Size-bounded, content-addressed file cache.
+    - Entries are immutable: the key is derived from content, so a stale hit is impossible.
+    - Writes are atomic (temp file + os.replace), safe across Celery processes.
+    - LRU by mtime: hits touch the file, eviction removes the oldest first.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, suffix: str = ".png"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = None # Lazily scanned, approximate between scans
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path_for(self, key: str) -> str:
+        # Shard by prefix to keep directories small
+        return os.path.join(self.directory, key[:2], f"{key}{self.suffix}")
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached file path or None."""
+        path = self.path_for(key)
+        try:
+            os.utime(path, None) # Mark as recently used
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def put(self, key: str, data: bytes) -> str:
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+        return path
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "size_bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(self.suffix):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue # Evicted by another process
+                yield path, st.st_size, st.st_mtime
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        # Rescan (other processes write to the same dir), then drop oldest until under 90% of budget
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self.evictions += 1
+            except FileNotFoundError:
+                total -= size
+        self._size = total
+        print(f"[Cache] Evicted down to {total // (1024 * 1024)}MB in {self.directory}")
@@ -0,0 +1,110 @@
+import io
+import os
+import time
+import random
+from typing import IO, Optional
+import httpx
+from app.core.config import settings
+
+# Shared HTTP client for asset downloads (Replicate outputs, Supabase URLs).
+# One pooled client per process: dozens of downloads per order reuse warm keep-alive
+# connections instead of paying a fresh TLS handshake each time.
+
+_client = None
+_client_pid = None
+
+# Transient statuses worth retrying
+_RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class DownloadTooLarge(ValueError):
+    pass
+
+
+def _http2_available() -> bool:
+    try:
+        import h2 # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_client() -> httpx.Client:
+    global _client, _client_pid
+    # Celery prefork: never reuse a client (and its sockets) inherited from the parent
+    if _client is not None and _client_pid == os.getpid():
+        return _client
+
+    _client = httpx.Client(
+        http2=_http2_available(),
+        timeout=httpx.Timeout(settings.HTTP_TIMEOUT_SECONDS, connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS),
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_POOL_SIZE,
+            max_keepalive_connections=settings.HTTP_POOL_SIZE,
+            keepalive_expiry=60.0,
+        ),
+        follow_redirects=True,
+    )
+    _client_pid = os.getpid()
+    return _client
+
+
+def _backoff(attempt: int) -> float:
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(10.0, 0.5 * (2 ** attempt)))
+
+
+def stream_to(url: str, sink: IO[bytes], max_bytes: Optional[int] = None, retries: Optional[int] = None) -> int:
+    """
+    Streams `url` into a writable binary sink, enforcing a size cap.
+    Retries transport errors and transient statuses with jittered backoff.
+    Returns the number of bytes written.
+    """
+    max_bytes = max_bytes or settings.HTTP_MAX_DOWNLOAD_MB * 1024 * 1024
+    retries = settings.HTTP_RETRIES if retries is None else retries
+    client = get_client()
+
+    for attempt in range(retries + 1):
+        sink.seek(0)
+        sink.truncate()
+        try:
+            with client.stream("GET", url) as resp:
+                if resp.status_code in _RETRY_STATUSES and attempt < retries:
+                    raise httpx.HTTPStatusError(f"Transient {resp.status_code}", request=resp.request, response=resp)
+                resp.raise_for_status()
+
+                declared = resp.headers.get("content-length")
+                if declared and int(declared) > max_bytes:
+                    raise DownloadTooLarge(f"{url} is {declared} bytes (cap {max_bytes})")
+
+                written = 0
+                for chunk in resp.iter_bytes(chunk_size=64 * 1024):
+                    written += len(chunk)
+                    if written > max_bytes:
+                        raise DownloadTooLarge(f"{url} exceeded {max_bytes} bytes")
+                    sink.write(chunk)
+                return written
+
+        except DownloadTooLarge:
+            raise
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+            if (status is not None and status not in _RETRY_STATUSES) or attempt >= retries:
+                raise
+            delay = _backoff(attempt)
+            print(f"[HTTP] {type(e).__name__} on {url[:80]} (attempt {attempt + 1}/{retries + 1}). Retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+
+def download_bytes(url: str, max_bytes: Optional[int] = None) -> bytes:
+    buf = io.BytesIO()
+    stream_to(url, buf, max_bytes=max_bytes)
+    return buf.getvalue()
+
+
+def download_buffer(url: str, max_bytes: Optional[int] = None) -> io.BytesIO:
+    """Returns a rewound BytesIO, ready for Image.open / np.frombuffer without an extra copy."""
+    buf = io.BytesIO()
+    stream_to(url, buf, max_bytes=max_bytes)
+    buf.seek(0)
+    return buf
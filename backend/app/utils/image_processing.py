@@ -1,11 +1,65 @@
 
 import io
+import os
+import tempfile
 import cv2
 import numpy as np
 from PIL import Image
 from rembg import remove
+from app.services.ai.onnx_runtime import get_rembg_session
+from app.core.config import settings
+from app.utils.disk_cache import DiskCache, content_key
+
+# Everything that changes the cleaned output must be in here (it is part of the cache key).
+# Bump "version" when the post-processing logic changes.
+MATTING_PARAMS = {
+    "model": "u2net",
+    "precision": settings.MATTING_MODEL_PRECISION,
+    "alpha_matting": False,
+    "min_island_area": 5000,
+    "version": 1,
+}
+
+# Global cleaned-image cache
+_cleaned_cache = None
+
+def get_cleaned_cache() -> DiskCache:
+    global _cleaned_cache
+    if _cleaned_cache is None:
+        _cleaned_cache = DiskCache(
+            os.path.join(settings.CACHE_DIR, "cleaned"),
+            max_bytes=settings.CLEANED_CACHE_MAX_MB * 1024 * 1024,
+        )
+    return _cleaned_cache
 
 def process_character_output(image_bytes: bytes) -> bytes:
+    """
+    Cleans a generated character image (see _clean_character_output) through the cleaned-image cache.
+    Keyed by SHA-256 of the input bytes + MATTING_PARAMS, so the same output is only matted once
+    and a changed input can never return a stale result.
+    Returns: Bytes of the processed, single-character PNG (or the input if cleaning failed).
+    """
+    cache = get_cleaned_cache()
+    key = content_key(image_bytes, MATTING_PARAMS)
+    cached_path = cache.get(key)
+    if cached_path:
+        try:
+            with open(cached_path, "rb") as f:
+                return f.read()
+        except OSError:
+            pass # Evicted between get() and open(), recompute
+
+    clean_bytes = _clean_character_output(image_bytes)
+    if clean_bytes is image_bytes:
+        # Post-processing failed and fell back to raw. Don't cache a failure.
+        return clean_bytes
+    try:
+        cache.put(key, clean_bytes)
+    except OSError as e:
+        print(f"[AutoClean] Cache write skipped: {e}")
+    return clean_bytes
+
+def _clean_character_output(image_bytes: bytes) -> bytes:
     """
     Processes the raw output from AI (Gemini):
     1. Removes background (ensure transparency).
@@ -20,7 +74,7 @@ def process_character_output(image_bytes: bytes) -> bytes:
         # 1. Remove Background
         # Input might already be transparent or white bg. rembg handles both.
         # [REVERTED] Disabled alpha_matting to match "Earlier" behavior which worked better.
-        output_png = remove(image_bytes)
+        output_png = remove(image_bytes, session=get_rembg_session(MATTING_PARAMS["model"]))
         
         # Convert to CV2 for analysis
         # Load as numpy array
@@ -52,7 +106,7 @@ def process_character_output(image_bytes: bytes) -> bytes:
             return output_png
             
         # Filter tiny noise
-        valid_contours = [c for c in contours if cv2.contourArea(c) > 5000] # Min area threshold (adjustable)
+        valid_contours = [c for c in contours if cv2.contourArea(c) > MATTING_PARAMS["min_island_area"]] # Min area threshold (adjustable)
         
         if len(valid_contours) <= 1:
              # 0 or 1 character -> Good.
@@ -83,33 +137,42 @@ def process_character_output(image_bytes: bytes) -> bytes:
         print(f"Post-processing failed: {e}. Returning raw.")
         return image_bytes
 
-def clean_image_file(input_path: str) -> str:
+def normalize_photo(input_path: str, output_path: str, max_edge: int = None) -> str:
     """
-    Reads an image from disk, cleans it (BG Remove + Erosion + Blur), 
-    and saves it to a new path (appended _cleaned.png).
-    Returns path to cleaned image.
+    One-time normalization of a user upload:
+    1. Applies the EXIF orientation (pixels end up upright, no tag needed).
+    2. Caps the long edge at max_edge (default UPLOAD_WORKING_MAX_EDGE).
+    3. Re-encodes without metadata (JPEG, or PNG if the photo has transparency).
+    Returns the written path (extension may change to .png).
     """
-    if not input_path or not os.path.exists(input_path):
-        return None
-        
-    try:
-        # Check cache
-        base, ext = os.path.splitext(input_path)
-        output_path = f"{base}_cleaned.png"
-        
-        if os.path.exists(output_path):
-            return output_path
-            
-        with open(input_path, "rb") as f:
-            raw_bytes = f.read()
-            
-        clean_bytes = process_character_output(raw_bytes)
-        
-        with open(output_path, "wb") as f:
-            f.write(clean_bytes)
-            
-        print(f"[AutoClean] Cleaned {input_path} -> {output_path}")
-        return output_path
-    except Exception as e:
-        print(f"[AutoClean] Failed to clean {input_path}: {e}")
-        return input_path # Fallback
+    from PIL import ImageOps
+
+    max_edge = max_edge or settings.UPLOAD_WORKING_MAX_EDGE
+    with Image.open(input_path) as img:
+        # JPEG: let the decoder scale down by 1/2..1/8 instead of decoding full size
+        if img.format == "JPEG":
+            img.draft("RGB", (max_edge, max_edge))
+        img = ImageOps.exif_transpose(img)
+
+        if max(img.size) > max_edge:
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+        if has_alpha:
+            output_path = os.path.splitext(output_path)[0] + ".png"
+            img, save_args = img.convert("RGBA"), {"format": "PNG", "optimize": True}
+        else:
+            img, save_args = img.convert("RGB"), {"format": "JPEG", "quality": settings.UPLOAD_JPEG_QUALITY, "optimize": True}
+
+        # Atomic write (temp file + os.replace): the output is shared by concurrent
+        # uploads of the same photo, and readers must never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(output_path) or ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                img.save(out, **save_args)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return output_path
@@ -0,0 +1,53 @@
+import os
+import re
+import mimetypes
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+from starlette.types import Scope
+
+# StaticFiles with cache headers and precompressed variants.
+# - Content-hashed names (publish_file: name.{16 hex}.ext) are immutable: cached for a year.
+# - Everything else must revalidate (ETag / Last-Modified -> 304, handled by Starlette).
+# - name.ext.br / name.ext.gz are served when the client accepts them (not for Range requests;
+#   ranges are served from the identity file by FileResponse).
+
+_HASHED_NAME_RE = re.compile(r"\.[0-9a-f]{16}\.[A-Za-z0-9]+$")
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "public, max-age=0, must-revalidate"
+
+_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+class CachedStaticFiles(StaticFiles):
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+
+        response = None
+        has_variants = False
+        accept_encoding = request_headers.get("accept-encoding", "")
+        for encoding, suffix in _ENCODINGS:
+            variant_path = full_path + suffix
+            if not os.path.exists(variant_path):
+                continue
+            has_variants = True
+            if response is None and encoding in accept_encoding and "range" not in request_headers:
+                media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+                response = FileResponse(variant_path, status_code=status_code,
+                                        stat_result=os.stat(variant_path), media_type=media_type)
+                response.headers["content-encoding"] = encoding
+
+        if response is None:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+
+        if has_variants:
+            response.headers["vary"] = "Accept-Encoding"
+        response.headers["cache-control"] = (
+            IMMUTABLE_CACHE if _HASHED_NAME_RE.search(os.path.basename(full_path)) else REVALIDATE_CACHE
+        )
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,199 @@
+import os
+import hashlib
+import tempfile
+from dataclasses import dataclass
+from typing import IO, Optional
+from python_multipart.multipart import MultipartParser, parse_options_header
+from app.core.config import settings
+
+# Streaming ingestion for user uploads.
+# The body is copied in chunks as it arrives from the socket: the size cap is
+# enforced as bytes arrive, the image header is sniffed from the first chunk
+# (unsupported formats are rejected before the rest is read), and the SHA-256 is
+# computed on the way through.
+
+# Magic bytes -> format. Only what the validator / InsightFace / rembg can decode.
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+)
+
+_HEADER_BYTES = 16
+
+EXTENSIONS = {"jpeg": ".jpg", "png": ".png", "webp": ".webp"}
+
+
+class UploadRejected(ValueError):
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass
+class IngestedUpload:
+    path: str # Temp file in the destination dir (caller moves/renames it)
+    sha256: str
+    size: int
+    format: str # jpeg | png | webp
+
+
+def max_upload_bytes() -> int:
+    return settings.UPLOAD_MAX_MB * 1024 * 1024
+
+
+def sniff_format(header: bytes) -> Optional[str]:
+    for signature, fmt in _SIGNATURES:
+        if header.startswith(signature):
+            return fmt
+    if len(header) >= 12 and header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+class StreamingIngest:
+    """
+    Incremental writer behind ingest() / ingest_request(): feed chunks with write(),
+    then finish(). Any UploadRejected (or other error) removes the temp file.
+    """
+
+    def __init__(self, dest_dir: str, max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes or max_upload_bytes()
+        os.makedirs(dest_dir, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=dest_dir, suffix=".part")
+        self._out = os.fdopen(fd, "wb")
+        self._digest = hashlib.sha256()
+        self._head = b""
+        self.size = 0
+        self.format = None
+
+    def write(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        if self.format is None:
+            # Buffer until the header can be sniffed (multipart parts may arrive in small pieces)
+            self._head += chunk
+            if len(self._head) < _HEADER_BYTES:
+                return
+            chunk, self._head = self._head, b""
+            self._sniff(chunk)
+        self._append(chunk)
+
+    def _sniff(self, header: bytes) -> None:
+        self.format = sniff_format(header[:_HEADER_BYTES])
+        if self.format is None:
+            raise UploadRejected("Unsupported image format (expected JPEG, PNG or WebP).", status_code=415)
+
+    def _append(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadRejected(f"File too large (max {self.max_bytes // (1024 * 1024)}MB).", status_code=413)
+        self._digest.update(chunk)
+        self._out.write(chunk)
+
+    def finish(self) -> IngestedUpload:
+        if self._head:
+            # Body shorter than the sniff window
+            head, self._head = self._head, b""
+            self._sniff(head)
+            self._append(head)
+        self._out.close()
+        if self.size == 0:
+            raise UploadRejected("Empty upload.")
+        return IngestedUpload(path=self.path, sha256=self._digest.hexdigest(), size=self.size, format=self.format)
+
+    def abort(self) -> None:
+        self._out.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def ingest(source: IO[bytes], dest_dir: str, max_bytes: Optional[int] = None) -> IngestedUpload:
+    """
+    Streams `source` into a temp file under dest_dir.
+    Raises UploadRejected (413 too large, 415 unsupported format, 400 empty).
+    """
+    writer = StreamingIngest(dest_dir, max_bytes)
+    try:
+        for chunk in iter(lambda: source.read(settings.UPLOAD_CHUNK_BYTES), b""):
+            writer.write(chunk)
+        return writer.finish()
+    except BaseException:
+        writer.abort()
+        raise
+
+
+async def ingest_request(request, dest_dir: str, field_name: str = "file", max_bytes: Optional[int] = None) -> IngestedUpload:
+    """
+    Streams an upload straight from the ASGI request body (nothing is spooled first):
+    either a multipart/form-data body (the `field_name` part is used) or a raw image body.
+    Raises UploadRejected like ingest(); the whole body is capped too, so a request
+    without Content-Length cannot stream unbounded data.
+    """
+    writer = StreamingIngest(dest_dir, max_bytes)
+    body_limit = writer.max_bytes + _ENVELOPE_BYTES
+    content_type, options = parse_options_header(request.headers.get("content-type"))
+    parser = None
+    if content_type == b"multipart/form-data":
+        if b"boundary" not in options:
+            writer.abort()
+            raise UploadRejected("Missing multipart boundary.")
+        parser = _file_part_parser(options[b"boundary"], field_name, writer)
+
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > body_limit:
+                raise UploadRejected(f"File too large (max {writer.max_bytes // (1024 * 1024)}MB).", status_code=413)
+            if parser is not None:
+                parser.write(chunk)
+            else:
+                writer.write(chunk)
+        if parser is not None:
+            parser.finalize()
+        return writer.finish()
+    except BaseException:
+        writer.abort()
+        raise
+
+
+# Allowance for the multipart envelope (boundaries, part headers, small form fields)
+_ENVELOPE_BYTES = 64 * 1024
+
+
+def _file_part_parser(boundary: bytes, field_name: str, writer: StreamingIngest) -> MultipartParser:
+    """Multipart parser that feeds only the `field_name` part into `writer`."""
+    state = {"header_field": b"", "header_value": b"", "headers": {}, "is_file": False}
+
+    def on_part_begin():
+        state["headers"] = {}
+        state["is_file"] = False
+
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = state["header_value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state["headers"].get(b"content-disposition"))
+        state["is_file"] = disposition.get(b"name") == field_name.encode()
+
+    def on_part_data(data, start, end):
+        if state["is_file"]:
+            writer.write(data[start:end])
+
+    return MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+    })
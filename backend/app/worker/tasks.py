@@ -1,8 +1,9 @@
 from app.core.celery_app import celery_app
-from app.services.ai import validator, replicate, insight, inpainting
+from app.services.ai import validator, replicate, insight, inpainting, identity_qc
 from app.services.compositor import engine
 from app.db.session import SessionLocal
 from app.db.models import Order, OrderStatus, Story
+from app.db import crud
 from app.schemas.book import BookConfig
 from app.services.storage.supabase_service import SupabaseService
 import time
@@ -10,6 +11,11 @@ import os
 import json
 import shutil
 from app.core.config import settings
+from app.services import order_cache
+from app.services.storage import local_storage
+
+# Every order/page commit made through SessionLocal is written through to Redis
+order_cache.enable_write_through(SessionLocal)
 
 # ... (Previous process_order_v2 code remains unchanged briefly, or we focus on approach_b)
 
@@ -380,20 +386,12 @@ def process_order_v2(self, order_id: str, photo_url: str):
                 if not final_path:
                     raise Exception("Compositing returned None")
 
-                # Move/Serve
-                filename = os.path.basename(final_path)
-                # Ensure URL matches global config (localhost vs ngrok)
-                from app.core.config import settings
-                page_url = f"{settings.BASE_URL}/uploads/pages/{filename}"
+                # Move/Serve (content-hashed, immutable URL)
+                stem = os.path.splitext(os.path.basename(final_path))[0]
+                page_url = local_storage.publish_file(final_path, "pages", stem)
                 
-                # Save to DB (New Record)
-                # Since we checked at the start, this is guaranteed to be new
-                db_page = OrderPage(
-                    order_id=order.id,
-                    page_number=page_conf.page_number,
-                    image_url=page_url
-                )
-                db.add(db_page)
+                # Save to DB (upsert: a concurrent retry of the same page cannot duplicate it)
+                crud.upsert_order_page(db, order.id, page_conf.page_number, page_url)
                 db.commit() # Commit immediately to save progress
                     
             except Exception as e:
@@ -420,12 +418,14 @@ def process_order_v2(self, order_id: str, photo_url: str):
             db.commit()
         return "FAILED_CRITICAL"
     finally:
+        upload_store.release_order(order_id)
         db.close()
 
 # ... existing imports ...
 from app.services.identity_service import IdentityService
 from app.services.generator_service import GeneratorService
 from app.services.compositor.engine import CompositorEngine
+from app.services import progress, admission, upload_store
 
 @celery_app.task(bind=True, max_retries=0)
 def process_approach_b(self, order_id: str, photo_url: str, book_id: str = "book_sample"):
@@ -438,11 +438,16 @@ def process_approach_b(self, order_id: str, photo_url: str, book_id: str = "book
     """
     print(f"Starting Approach B (Simple Mode) for Order {order_id}...")
     db = SessionLocal()
-    order = db.query(Order).get(order_id)
-    if not order:
-        return "ORDER_NOT_FOUND"
-
+    order = None
+    started_at = time.time()
     try:
+        # Inside the try: the finally below frees the admission slot and upload refs on every path
+        order = db.query(Order).get(order_id)
+        if not order:
+            return "ORDER_NOT_FOUND"
+
+        admission.order_started(order_id)
+        progress.publish(order_id, progress.EVENT_STARTED, book_id=book_id)
         # Config
         assets_root = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "assets")
         comp_service = CompositorEngine(assets_root)
@@ -495,11 +500,28 @@ def process_approach_b(self, order_id: str, photo_url: str, book_id: str = "book
 
         pages = sorted([p for p in os.listdir(template_pages_dir) if p.startswith("p")])
         print(f"Found pages: {pages}")
+        total_pages = len(pages)
 
-        from app.db.models import OrderPage
         from app.core.config import settings
 
         results = []
+        qc_assets = [] # Generated page characters for batch QC
+        page_maps = {} # page_id -> (page_num, character map used for its composite)
+
+        def composite_and_persist(page_id, page_num, page_map):
+            final_page_path = comp_service.composite_page(book_id, page_id, page_map)
+            if not final_page_path:
+                return None
+
+            # Save & Persist (content-hashed name: a regenerated page gets a new, cacheable URL)
+            page_url = local_storage.publish_file(final_page_path, "pages", f"order_{order.id}_{page_id}")
+            
+            # DB Update (single upsert; returns the URL it replaced, if any)
+            previous_url = crud.upsert_order_page(db, order.id, page_num, page_url)
+            db.commit()
+            if previous_url and previous_url != page_url:
+                local_storage.unpublish(previous_url)
+            return page_url
 
         for page_folder in pages:
             page_id = page_folder
@@ -541,12 +563,14 @@ def process_approach_b(self, order_id: str, photo_url: str, book_id: str = "book
                     order_id=str(order.id),
                     user_photo_path=user_photo_path,
                     master_ref_path=master_ref_path,
-                    role=role
+                    role=role,
+                    book_id=book_id
                 )
                 
                 if master_path:
                     master_map[role] = master_path
                     print(f"Master {role} Saved: {master_path}")
+                    progress.publish(order_id, progress.EVENT_MASTER_READY, role=role)
                 else:
                     print(f"Master Generation Failed for {role}")
             
@@ -582,48 +606,57 @@ def process_approach_b(self, order_id: str, photo_url: str, book_id: str = "book
 
                 # UPDATE MAP
                 if gen_page_path:
+                    progress.publish(order_id, progress.EVENT_PAGE_GENERATED, page=page_num, role=role)
                     current_map[role] = gen_page_path # Best: Page Gen
+                    qc_assets.append(identity_qc.PageAsset(page_id=page_id, role=role, path=gen_page_path))
                 else:
                     print(f"Fallback: Using Master Character for {role} on {page_id}")
                     current_map[role] = master_path # Fallback: Master
             
             # Composite using the updated map (Raw -> Master -> PageGen)
-            
-            # Composite using the (potentially new) map
-            final_page_path = comp_service.composite_page(book_id, page_id, current_map)
-            
-            if final_page_path:
-                # Save & Persist
-                uploads_dir = os.path.join(os.getcwd(), "uploads", "pages")
-                os.makedirs(uploads_dir, exist_ok=True)
-                
-                filename = f"order_{order.id}_{page_id}.png"
-                public_path = os.path.join(uploads_dir, filename)
-                shutil.copy2(final_page_path, public_path)
-                
-                page_url = f"{settings.BASE_URL}/uploads/pages/{filename}"
+            page_maps[page_id] = (page_num, current_map)
+            page_url = composite_and_persist(page_id, page_num, current_map)
+            if page_url:
                 results.append(page_url)
-                
-                # DB Update
-                existing_page = db.query(OrderPage).filter(
-                    OrderPage.order_id == order.id,
-                    OrderPage.page_number == page_num
-                ).first()
+                progress.publish(order_id, progress.EVENT_PAGE_COMPOSITED,
+                                 page=page_num, image_url=page_url, completed=len(results), total=total_pages)
 
-                if existing_page:
-                    existing_page.image_url = page_url
-                else:
-                    db_page = OrderPage(
-                        order_id=order.id,
-                        page_number=page_num,
-                        image_url=page_url
-                    )
-                    db.add(db_page)
-                db.commit()
+        # -------------------------------------------------------------
+        # Batch Identity QC: every generated page character at once,
+        # regenerate only the outliers (one retry each).
+        # -------------------------------------------------------------
+        if settings.QC_ENABLED and qc_assets:
+            qc_results = identity_qc.run_batch_qc(master_map, qc_assets)
+
+            flagged_by_page = {}
+            for qc in qc_results:
+                if qc.flagged:
+                    flagged_by_page.setdefault(qc.asset.page_id, []).append(qc.asset.role)
+
+            if flagged_by_page and settings.QC_REGENERATE:
+                print(f"QC flagged {sum(len(r) for r in flagged_by_page.values())} page assets. Regenerating...")
+                for page_id, roles in flagged_by_page.items():
+                    page_num, page_map = page_maps[page_id]
+                    for role in roles:
+                        regenerated = gen_service.generate_page_character(
+                            order_id=str(order.id),
+                            master_path=master_map[role],
+                            page_ref_path=os.path.join(template_pages_dir, page_id, f"ref_{role}.png"),
+                            page_id=page_id,
+                            role=role
+                        )
+                        # generate_page_character removes the old asset first, so fall back to master on failure
+                        page_map[role] = regenerated or master_map[role]
+                    page_url = composite_and_persist(page_id, page_num, page_map)
+                    if page_url:
+                        progress.publish(order_id, progress.EVENT_PAGE_COMPOSITED,
+                                         page=page_num, image_url=page_url, regenerated=True,
+                                         completed=len(results), total=total_pages)
         
         # Mark Complete
         order.status = OrderStatus.COMPLETED
         db.commit()
+        progress.publish(order_id, progress.EVENT_COMPLETED, completed=len(results), total=total_pages)
         
         print(f"Approach B (Simple Mode) Complete. Generated {len(results)} pages.")
         return "COMPLETED"
@@ -632,9 +665,51 @@ def process_approach_b(self, order_id: str, photo_url: str, book_id: str = "book
         print(f"Approach B Failed: {e}")
         import traceback
         traceback.print_exc()
-        order.status = OrderStatus.FAILED
-        order.failure_reason = str(e)
-        db.commit()
+        if order:
+            order.status = OrderStatus.FAILED
+            order.failure_reason = str(e)
+            db.commit()
+        progress.publish(order_id, progress.EVENT_FAILED, reason=str(e))
         return "FAILED"
     finally:
+        # Only real runs feed the duration average
+        admission.order_finished(order_id, duration_seconds=time.time() - started_at if order else None)
+        upload_store.release_order(order_id)
         db.close()
+
+# -------------------------------------------------------------
+# Upload Validation (dedicated 'validation' queue, see celery_app)
+# -------------------------------------------------------------
+from app.services import validation_jobs
+
+@celery_app.task(bind=True, max_retries=0)
+def validate_upload(self, upload_id: str, photo_url: str, content_hash: str = None):
+    """
+    Runs photo validation off the web process.
+    Result is written to Redis for GET /orders/upload/{upload_id}, and cached on the
+    stored upload so re-uploads of the same photo skip validation.
+    """
+    try:
+        result = validator.validate_photo(photo_url)
+        if content_hash and validator.is_definitive(result):
+            upload_store.save_validation(content_hash, result)
+        validation_jobs.set_status(
+            upload_id,
+            validation_jobs.STATUS_DONE,
+            url=photo_url,
+            valid=result["valid"],
+            reason=result.get("reason", ""),
+            checks=result.get("checks", {})
+        )
+        return "VALID" if result["valid"] else "INVALID"
+    except Exception as e:
+        print(f"Upload Validation Error [{upload_id}]: {e}")
+        validation_jobs.set_status(
+            upload_id,
+            validation_jobs.STATUS_FAILED,
+            url=photo_url,
+            valid=False,
+            reason=f"System Error processing photo: {str(e)}",
+            checks={}
+        )
+        return "FAILED"
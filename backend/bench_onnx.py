@@ -0,0 +1,138 @@
+"""
+ONNX Runtime throughput benchmark for worker layouts.
+
+Simulates N worker processes (like `celery worker --concurrency=N`) each running
+InsightFace detection+recognition and rembg on the same image, and reports images/sec.
+
+Usage (from backend/):
+    python bench_onnx.py --image ../test_input.jpg --procs 1 --iters 10
+    ONNX_INTRA_OP_THREADS=2 python bench_onnx.py --image ../test_input.jpg --procs 4 --iters 10
+    # All documented layouts (solo, prefork x N auto, prefork x N pinned) + host spec,
+    # printed as a table for Info.txt:
+    python bench_onnx.py --image ../test_input.jpg --layouts --procs 4 --iters 10
+"""
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import time
+import platform
+from queue import Empty
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _worker(image_path: str, iters: int, queue):
+    import cv2
+    from rembg import remove
+    from app.services.ai.insight import get_app
+    from app.services.ai.onnx_runtime import get_rembg_session
+
+    face_app = get_app()
+    if face_app is None:
+        raise SystemExit("InsightFace failed to load (models not downloadable?)")
+    session = get_rembg_session()
+    img = cv2.imread(image_path)
+    with open(image_path, "rb") as f:
+        raw = f.read()
+
+    # Warmup (arena allocation, graph optimization)
+    face_app.get(img)
+    remove(raw, session=session)
+
+    start = time.perf_counter()
+    for _ in range(iters):
+        face_app.get(img)
+        remove(raw, session=session)
+    queue.put(time.perf_counter() - start)
+
+
+def run_layout(image_path: str, procs: int, iters: int, env: dict = None) -> float:
+    """Runs one layout in fresh (spawned) processes so ONNX_* env overrides apply. Returns images/sec."""
+    previous = {k: os.environ.get(k) for k in (env or {})}
+    os.environ.update(env or {})
+    try:
+        ctx = mp.get_context("spawn")
+        queue = ctx.Queue()
+        workers = [ctx.Process(target=_worker, args=(image_path, iters, queue)) for _ in range(procs)]
+        wall_start = time.perf_counter()
+        for p in workers:
+            p.start()
+        timings = []
+        while len(timings) < procs:
+            try:
+                timings.append(queue.get(timeout=5))
+            except Empty:
+                if not any(p.is_alive() for p in workers):
+                    raise RuntimeError("A benchmark process exited without a result (see its error above)")
+        for p in workers:
+            p.join()
+        wall = time.perf_counter() - wall_start
+    finally:
+        for k, v in previous.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+    total = procs * iters
+    print(f"Per-process: {[round(t, 2) for t in timings]} s")
+    print(f"Throughput: {total / max(timings):.2f} images/sec ({total} images, wall {wall:.1f}s incl. model load)")
+    return total / max(timings)
+
+
+def host_spec() -> str:
+    cpu = platform.processor() or platform.machine()
+    try:
+        with open("/proc/cpuinfo") as f:
+            cpu = next(line.split(":", 1)[1].strip() for line in f if line.startswith("model name"))
+    except (OSError, StopIteration):
+        pass
+    mem = ""
+    try:
+        with open("/proc/meminfo") as f:
+            kb = int(next(line.split()[1] for line in f if line.startswith("MemTotal")))
+        mem = f", {kb / 1024 / 1024:.1f} GB RAM"
+    except (OSError, StopIteration, ValueError):
+        pass
+    return f"{cpu}, {os.cpu_count()} vCPU{mem}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image", required=True)
+    parser.add_argument("--procs", type=int, default=1)
+    parser.add_argument("--iters", type=int, default=10)
+    parser.add_argument("--layouts", action="store_true", help="Run solo / prefork auto / prefork pinned (--procs = N)")
+    args = parser.parse_args()
+
+    if args.layouts:
+        n = max(2, args.procs)
+        pinned = str(max(1, (os.cpu_count() or 1) // n))
+        layouts = [
+            ("solo (1 proc)", 1, "auto", "auto", {}),
+            (f"prefork x{n}, default threads", n, "auto", "auto", {}),
+            (f"prefork x{n}, pinned threads", n, pinned, "1",
+             {"ONNX_INTRA_OP_THREADS": pinned, "ONNX_INTER_OP_THREADS": "1"}),
+        ]
+        rows = []
+        for name, procs, intra, inter, env in layouts:
+            print(f"== {name} ==")
+            rows.append((name, intra, inter, run_layout(args.image, procs, args.iters, env)))
+        print(f"\nHost: {host_spec()} (image {os.path.basename(args.image)}, {args.iters} iters/proc)")
+        print("| Layout | intra | inter | images/sec |")
+        print("|---|---|---|---|")
+        for name, intra, inter, ips in rows:
+            print(f"| {name} | {intra} | {inter} | {ips:.2f} |")
+        return
+
+    from app.core.config import settings
+    print(f"Layout: {args.procs} procs x intra={settings.ONNX_INTRA_OP_THREADS or 'auto'} "
+          f"inter={settings.ONNX_INTER_OP_THREADS or 'auto'} "
+          f"opt={settings.ONNX_GRAPH_OPTIMIZATION} mode={settings.ONNX_EXECUTION_MODE} "
+          f"arena={settings.ONNX_ENABLE_MEM_ARENA} (cpus={os.cpu_count()})")
+    run_layout(args.image, args.procs, args.iters)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Quantization accuracy/speed report (fp32 vs int8).
+
+Runs InsightFace (buffalo_s) and rembg (u2net) in both precisions over a local
+folder of sample photos and reports:
+  - speedup per model
+  - face detection agreement (same face count, bbox IoU of the primary face)
+  - embedding agreement (cosine similarity fp32 vs int8 of the primary face)
+  - matting agreement (mask IoU of alpha > 128)
+
+Usage (from backend/):
+    python eval_quantization.py --samples ../sample\\ Book --iters 3
+Then set FACE_MODEL_PRECISION / MATTING_MODEL_PRECISION=int8 where quality holds up.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from insightface.app import FaceAnalysis
+from rembg import remove
+from app.services.ai import onnx_runtime
+
+
+def _load_face_app(precision: str):
+    face_app = FaceAnalysis(name='buffalo_s', providers=onnx_runtime.get_providers())
+    onnx_runtime.apply_to_face_analysis(face_app, precision=precision)
+    face_app.prepare(ctx_id=0, det_size=(640, 640))
+    return face_app
+
+
+def _primary(faces):
+    if not faces:
+        return None
+    return sorted(faces, key=lambda f: (f.bbox[2]-f.bbox[0])*(f.bbox[3]-f.bbox[1]), reverse=True)[0]
+
+
+def _bbox_iou(a, b) -> float:
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2]-a[0])*(a[3]-a[1]) + (b[2]-b[0])*(b[3]-b[1]) - inter
+    return float(inter / union) if union > 0 else 0.0
+
+
+def _timed(fn, iters: int):
+    result = fn() # Warmup + result
+    start = time.perf_counter()
+    for _ in range(iters):
+        fn()
+    return result, (time.perf_counter() - start) / max(iters, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", required=True, help="Folder of sample photos (jpg/png)")
+    parser.add_argument("--iters", type=int, default=3)
+    args = parser.parse_args()
+
+    paths = sorted(
+        p for ext in ("*.jpg", "*.jpeg", "*.png") for p in glob.glob(os.path.join(args.samples, ext))
+    )
+    if not paths:
+        print(f"No images found in {args.samples}")
+        return
+
+    faces = {p: _load_face_app(p) for p in ("fp32", "int8")}
+    matting = {p: onnx_runtime.get_rembg_session("u2net", precision=p) for p in ("fp32", "int8")}
+
+    face_time = {"fp32": 0.0, "int8": 0.0}
+    mat_time = {"fp32": 0.0, "int8": 0.0}
+    count_agree, bbox_ious, emb_sims, mask_ious = 0, [], [], []
+
+    for path in paths:
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is None:
+            print(f"Skipping unreadable {path}")
+            continue
+        with open(path, "rb") as f:
+            raw = f.read()
+
+        det = {}
+        masks = {}
+        for precision in ("fp32", "int8"):
+            det[precision], t = _timed(lambda: faces[precision].get(img), args.iters)
+            face_time[precision] += t
+            out, t = _timed(lambda: remove(raw, session=matting[precision]), args.iters)
+            mat_time[precision] += t
+            rgba = cv2.imdecode(np.frombuffer(out, np.uint8), cv2.IMREAD_UNCHANGED)
+            masks[precision] = rgba[:, :, 3] > 128
+
+        if len(det["fp32"]) == len(det["int8"]):
+            count_agree += 1
+        ref, quant = _primary(det["fp32"]), _primary(det["int8"])
+        if ref is not None and quant is not None:
+            bbox_ious.append(_bbox_iou(ref.bbox, quant.bbox))
+            emb_sims.append(float(np.dot(ref.normed_embedding, quant.normed_embedding)))
+
+        inter = np.logical_and(masks["fp32"], masks["int8"]).sum()
+        union = np.logical_or(masks["fp32"], masks["int8"]).sum()
+        mask_ious.append(float(inter / union) if union else 1.0)
+
+        print(f"{os.path.basename(path)}: faces {len(det['fp32'])}/{len(det['int8'])}, "
+              f"emb sim {emb_sims[-1] if emb_sims else float('nan'):.4f}, mask IoU {mask_ious[-1]:.4f}")
+
+    n = len(mask_ious)
+    print("\n=== Quantization Report ===")
+    print(f"Samples: {n}")
+    print(f"InsightFace  fp32 {face_time['fp32'] / n * 1000:.1f}ms  int8 {face_time['int8'] / n * 1000:.1f}ms  "
+          f"speedup x{face_time['fp32'] / max(face_time['int8'], 1e-9):.2f}")
+    print(f"rembg u2net  fp32 {mat_time['fp32'] / n * 1000:.1f}ms  int8 {mat_time['int8'] / n * 1000:.1f}ms  "
+          f"speedup x{mat_time['fp32'] / max(mat_time['int8'], 1e-9):.2f}")
+    print(f"Face count agreement: {count_agree}/{n}")
+    if bbox_ious:
+        print(f"Primary bbox IoU: mean {np.mean(bbox_ious):.4f}  min {np.min(bbox_ious):.4f}")
+        print(f"Embedding cosine (fp32 vs int8): mean {np.mean(emb_sims):.4f}  min {np.min(emb_sims):.4f}")
+    print(f"Mask IoU: mean {np.mean(mask_ious):.4f}  min {np.min(mask_ious):.4f}")
+
+
+if __name__ == "__main__":
+    main()
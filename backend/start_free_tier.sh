@@ -7,8 +7,11 @@ redis-server --daemonize yes
 # Override config to use Local Redis
 export REDIS_URL="redis://localhost:6379/0"
 
-# 2. Start Celery Worker
-celery -A app.core.celery_app worker --loglevel=info &
+# 2. Start Celery Workers
+# Orders (long book generation) and photo validation run in separate processes,
+# so an upload is validated while an order is being generated.
+celery -A app.core.celery_app worker -Q celery -n orders@%h --loglevel=info &
+celery -A app.core.celery_app worker -Q validation -c 1 -n validation@%h --loglevel=info &
 
 # Start FastAPI App
 uvicorn app.main:app --host 0.0.0.0 --port 7860
@@ -16,6 +16,34 @@ def migrate():
         except Exception as e:
             print(f"mom_photo_url error (maybe exists): {e}")
 
+        try:
+            conn.execute(text("ALTER TABLE orders ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0;"))
+            print("Added version column.")
+        except Exception as e:
+            print(f"version error: {e}")
+
+        for name, columns in (
+            ("ix_orders_created_at_id", "created_at, id"),
+            ("ix_orders_status_created_at_id", "status, created_at, id"),
+            ("ix_orders_story_created_at_id", "story_id, created_at, id"),
+        ):
+            try:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON orders ({columns});"))
+                print(f"Added {name} index.")
+            except Exception as e:
+                print(f"{name} error: {e}")
+
+        try:
+            # Keep the newest row per page (rows from racing retries), then enforce uniqueness
+            conn.execute(text("""
+                DELETE FROM order_pages a USING order_pages b
+                WHERE a.order_id = b.order_id AND a.page_number = b.page_number AND a.ctid < b.ctid;
+            """))
+            conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_order_pages_order_page ON order_pages (order_id, page_number);"))
+            print("Added uq_order_pages_order_page index.")
+        except Exception as e:
+            print(f"uq_order_pages_order_page error: {e}")
+
         conn.commit()
         print("Migration complete.")
 
@@ -65,7 +65,9 @@ function CreatePageContent() {
             );
             router.push(`/orders/${order.id}`);
         } catch (err) {
-            setError("Failed to create order. Please try again.");
+            setError(err instanceof Error && err.message !== "Failed to create order"
+                ? err.message
+                : "Failed to create order. Please try again.");
             setSubmitting(false);
         }
     };
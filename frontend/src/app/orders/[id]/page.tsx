@@ -19,12 +19,22 @@ export default function OrderStatusPage() {
         let intervalId: NodeJS.Timeout;
         let timerId: NodeJS.Timeout;
 
+        let etag: string | null = null;
+        let finished = false; // Terminal status seen: no more polling
+
         const fetchOrder = async () => {
+            if (finished) return;
             try {
+                // Cheap conditional poll; the full order is only fetched when it changed
+                const polled = await api.getOrderStatus(id, etag);
+                if (!polled) return; // 304 Not Modified
+                etag = polled.etag;
+
                 const data = await api.getOrder(id);
                 setOrder(data);
 
                 if (data.status === 'COMPLETED' || data.status === 'FAILED') {
+                    finished = true;
                     setLoading(false);
                     clearInterval(intervalId); // Stop polling
                     clearInterval(timerId); // Stop timer
@@ -49,10 +59,31 @@ export default function OrderStatusPage() {
         // Initial fetch
         fetchOrder();
 
-        // Poll every 3 seconds
-        intervalId = setInterval(fetchOrder, 3000);
+        // Live progress over SSE; the order is refetched only when the worker reports progress.
+        // Falls back to polling (every 3 seconds) if the stream is unavailable.
+        let source: EventSource | null = null;
+        const startPolling = () => {
+            source?.close();
+            source = null;
+            // The stream also closes normally after a terminal snapshot/event
+            if (!finished && !intervalId) intervalId = setInterval(fetchOrder, 3000);
+        };
+
+        if (typeof EventSource !== 'undefined') {
+            source = api.streamOrderEvents(id);
+            ['page_composited', 'completed', 'failed'].forEach((name) =>
+                source?.addEventListener(name, () => {
+                    if (name !== 'page_composited') source?.close();
+                    fetchOrder();
+                })
+            );
+            source.onerror = startPolling;
+        } else {
+            startPolling();
+        }
 
         return () => {
+            source?.close();
             clearInterval(intervalId);
             clearInterval(timerId);
         };
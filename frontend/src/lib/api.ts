@@ -57,11 +57,24 @@ export interface Order {
   }[];
 }
 
+export interface OrderStatus {
+  id: string;
+  status: string;
+  completed_pages: number;
+  version: number;
+  failure_reason: string | null;
+}
+
 // Books (Dynamic)
 export interface Book {
   id: string;
   title: string;
-  cover_url: string;
+  cover_url: string; // Thumbnail when available
+  cover_full_url?: string;
+  description?: string | null;
+  page_count?: number;
+  roles?: string[];
+  version?: string | null;
 }
 
 // API Methods
@@ -135,7 +148,34 @@ export const api = {
       const error = await response.json();
       throw new Error(error.detail || "Upload failed");
     }
-    return response.json();
+    const upload = await response.json();
+    if (!upload.upload_id || upload.status === "DONE") {
+      // Upload failed, or the same photo was validated before:
+      // response already carries valid/reason/checks
+      return upload;
+    }
+
+    // Validation runs in the background; poll until it finishes
+    const deadline = Date.now() + 120_000;
+    while (Date.now() < deadline) {
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+      const statusResponse = await fetch(
+        `${API_BASE}/api/v1/orders/upload/${upload.upload_id}`
+      );
+      if (!statusResponse.ok) {
+        throw new Error("Failed to fetch validation status");
+      }
+      const job = await statusResponse.json();
+      if (job.status === "DONE" || job.status === "FAILED") {
+        return {
+          url: job.url || upload.url,
+          valid: Boolean(job.valid),
+          reason: job.reason,
+          checks: job.checks,
+        };
+      }
+    }
+    throw new Error("Photo validation timed out");
   },
 
   async createOrder(
@@ -157,6 +197,11 @@ export const api = {
       }),
     });
 
+    if (response.status === 503) {
+      // Admission control: worker is at capacity
+      const busy = await response.json();
+      throw new Error(busy.detail || "We're busy right now. Please try again shortly.");
+    }
     if (!response.ok) throw new Error("Failed to create order");
     return response.json();
   },
@@ -166,4 +211,23 @@ export const api = {
     if (!response.ok) throw new Error("Failed to fetch order");
     return response.json();
   },
+
+  // Server-Sent Events: stage events for an order (snapshot, page_composited, completed, failed, ...)
+  streamOrderEvents(orderId: string): EventSource {
+    return new EventSource(`${API_BASE}/api/v1/orders/${orderId}/events`);
+  },
+
+  // Lightweight poll: returns null when nothing changed since `etag` (304)
+  async getOrderStatus(
+    orderId: string,
+    etag?: string | null
+  ): Promise<{ status: OrderStatus; etag: string | null } | null> {
+    const response = await fetch(`${API_BASE}/api/v1/orders/${orderId}/status`, {
+      cache: "no-store",
+      headers: etag ? { "If-None-Match": etag } : {},
+    });
+    if (response.status === 304) return null;
+    if (!response.ok) throw new Error("Failed to fetch order status");
+    return { status: await response.json(), etag: response.headers.get("ETag") };
+  },
 };
@@ -30,15 +30,12 @@ def main():
         # 1. Identity Phase (Multi-Face)
         print("\n--- PHASE 1: Identity ---")
         
-        # Heuristic: Assuming Index 0 (Largest) is Mom, Index 1 (Second) is Child
-        # Note: If image has only 1 face, this will fail on index 1.
-        # But user said image has 2 people.
-        
-        print("Extracting MOM Identity (Index 0)...")
-        identity_mom = id_service.create_identity(order_id, user_photo_path, role="mom", face_index=0)
-        
-        print("Extracting CHILD Identity (Index 1)...")
-        identity_child = id_service.create_identity(order_id, user_photo_path, role="child", face_index=1)
+        # Heuristic: Largest face is Mom, second largest is Child
+        # (one detection pass for both; use assigner="age" or "position" for other layouts)
+        print("Extracting MOM + CHILD Identities...")
+        identities = id_service.create_identities(order_id, user_photo_path, roles=["mom", "child"], assigner="size")
+        identity_mom = identities["mom"]
+        identity_child = identities["child"]
         
         print("Identities Created.")
 